@@ -70,7 +70,7 @@ class ReflexCaptureAgent(CaptureAgent):
 
     # You can profile your evaluation time by uncommenting these lines
     # start = time.time()
-    values = [self.evaluate(gameState, a) for a in actions]
+    values = self.evaluateActions(gameState, actions)
     # print 'eval time for agent %d: %.4f' % (self.index, time.time() - start)
 
     maxValue = max(values)
@@ -111,6 +111,13 @@ class ReflexCaptureAgent(CaptureAgent):
     weights = self.getWeights(gameState, action)
     return features * weights
 
+  def evaluateActions(self, gameState: capture.GameState, actions):
+    """
+    The evaluation of each action in turn (see BatchEvaluationMixin to
+    score them in one batch)
+    """
+    return [self.evaluate(gameState, a) for a in actions]
+
   def getFeatures(self, gameState: capture.GameState, action):
     """
     Returns a counter of features for the state
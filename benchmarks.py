@@ -0,0 +1,731 @@
+# benchmarks.py
+# -------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Performance benchmarks for the capture framework.
+
+Each benchmark is run from the command line by name, e.g.
+
+  > python benchmarks.py distances
+  > python benchmarks.py distances -l jumboCapture,RANDOM13
+
+Run 'python benchmarks.py --help' for the list of benchmarks.
+"""
+
+import sys, os, time, glob
+import layout, capture
+
+def getLayouts(names = None):
+  """
+  Returns a list of (name, layout) pairs.  With no names, every layout in
+  the layouts/ directory is used; RANDOM<seed> names generate random mazes.
+  """
+  if not names:
+    names = sorted(os.path.basename(f)[:-4] for f in glob.glob('layouts/*.lay'))
+  layouts = []
+  for name in names:
+    if name.startswith('RANDOM'):
+      l = layout.Layout(capture.randomLayout(int(name[6:])).split('\n'))
+    else:
+      l = layout.getLayout(name)
+    if l == None: raise Exception("The layout " + name + " cannot be found")
+    layouts.append((name, l))
+  return layouts
+
+def residentMemory():
+  "Returns the resident set size of this process in bytes."
+  try:
+    with open('/proc/self/statm') as f:
+      return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+  except (IOError, OSError):
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def privateMemory():
+  """
+  Returns the memory that belongs to this process alone (resident pages not
+  shared with any other process) in bytes, or None if it cannot be read.
+  """
+  try:
+    with open('/proc/self/smaps_rollup') as f:
+      fields = dict(line.split(':', 1) for line in f if ':' in line)
+    return sum(int(fields[key].split()[0]) for key in ['Private_Clean', 'Private_Dirty']) * 1024
+  except (IOError, OSError, KeyError, ValueError):
+    return None
+
+def runIsolated(function, *args):
+  """
+  Runs function(*args) in a fresh interpreter so that memory measurements
+  are not polluted by earlier runs, and returns its result.
+  """
+  import multiprocessing
+  pool = multiprocessing.get_context('spawn').Pool(1)
+  try:
+    return pool.apply(function, args)
+  finally:
+    pool.terminate()
+
+def printTable(header, rows):
+  widths = [max(len(str(row[i])) for row in [header] + rows) for i in range(len(header))]
+  for row in [header] + rows:
+    print('  '.join(str(cell).rjust(width) for cell, width in zip(row, widths)))
+
+##################
+# Maze distances #
+##################
+
+def legacyComputeDistances(layout):
+  """
+  The original all-pairs computation: a heap-based UCS from every open cell,
+  with the results stored in a dict keyed by ((x,y),(x,y)).  Kept here as the
+  reference point for the distances benchmark.
+  """
+  import util
+  distances = {}
+  allNodes = layout.walls.asList(False)
+  for source in allNodes:
+    dist = {}
+    closed = {}
+    for node in allNodes:
+      dist[node] = sys.maxsize
+    queue = util.PriorityQueue()
+    queue.push(source, 0)
+    dist[source] = 0
+    while not queue.isEmpty():
+      node = queue.pop()
+      if node in closed:
+        continue
+      closed[node] = True
+      nodeDist = dist[node]
+      x, y = node
+      for other in [(x,y+1), (x,y-1), (x+1,y), (x-1,y)]:
+        if layout.isWall(other) or not other in dist:
+          continue
+        if nodeDist + 1 < dist[other]:
+          dist[other] = nodeDist + 1
+          queue.push(other, nodeDist + 1)
+    for target in allNodes:
+      distances[(target, source)] = dist[target]
+  return distances
+
+def _measureDistances(engine, name):
+  import distanceCalculator
+  compute = {'legacy': legacyComputeDistances, 'bfs': distanceCalculator.computeDistances}[engine]
+  l = dict(getLayouts([name]))[name]
+  before = residentMemory()
+  start = time.perf_counter()
+  distances = compute(l)
+  elapsed = time.perf_counter() - start
+  return elapsed, residentMemory() - before, len(distances)
+
+def benchmarkDistances(names):
+  """
+  Startup time and resident memory of the all-pairs maze distance table,
+  legacy UCS + dict versus BFS + dense matrix.
+  """
+  rows = []
+  for name, l in getLayouts(names):
+    legacyTime, legacyMemory, pairs = runIsolated(_measureDistances, 'legacy', name)
+    bfsTime, bfsMemory, _ = runIsolated(_measureDistances, 'bfs', name)
+    rows.append([name, len(l.walls.asList(False)), pairs,
+                 '%.3f' % legacyTime, '%.3f' % bfsTime, '%.1fx' % (legacyTime / max(bfsTime, 1e-9)),
+                 '%d' % (legacyMemory // 1024), '%d' % (bfsMemory // 1024)])
+  printTable(['layout', 'cells', 'pairs', 'ucs(s)', 'bfs(s)', 'speedup', 'ucs(KiB)', 'bfs(KiB)'], rows)
+
+def _attachDistances(cacheDir, name):
+  import distanceCalculator
+  distanceCalculator.CACHE_DIR = cacheDir
+  l = dict(getLayouts([name]))[name]
+  before = privateMemory()
+  start = time.perf_counter()
+  distancer = distanceCalculator.Distancer(l)
+  distancer.getMazeDistances()
+  elapsed = time.perf_counter() - start
+  # Touch every entry so that all pages of the table are resident
+  sum(distancer._distances.distances)
+  return elapsed, privateMemory() - before, residentMemory()
+
+def benchmarkSharedDistances(names, processes = 4):
+  """
+  Private memory of each game process once it holds the distance table,
+  with every process computing its own table versus the table being
+  published once and mapped by the rest.
+  """
+  import multiprocessing, tempfile, shutil
+  if privateMemory() is None:
+    print('Private memory is not measurable on this platform')
+    return
+  rows = []
+  for name, l in getLayouts(names):
+    cacheDir = tempfile.mkdtemp()
+    try:
+      for mode, directory in [('private', ''), ('shared', cacheDir)]:
+        pool = multiprocessing.get_context('spawn').Pool(processes)
+        try:
+          results = pool.starmap(_attachDistances, [(directory, name)] * processes)
+        finally:
+          pool.terminate()
+        for process, (elapsed, private, resident) in enumerate(results):
+          rows.append([name, len(l.walls.asList(False)), mode, process,
+                       '%.3f' % elapsed, private // 1024, resident // 1024])
+    finally:
+      shutil.rmtree(cacheDir)
+  printTable(['layout', 'cells', 'table', 'process', 'load(s)', 'private(KiB)', 'rss(KiB)'], rows)
+
+#################
+# Game overhead #
+#################
+
+from captureAgents import CaptureAgent
+
+class TimedRandomAgent(CaptureAgent):
+  """
+  A random agent that keeps track of how long its own decision code runs,
+  so that everything else Game.run does can be attributed to the framework.
+  """
+  def __init__(self, index):
+    CaptureAgent.__init__(self, index)
+    self.agentTime = 0.0
+    self.random = __import__('random').Random(index)
+
+  def registerInitialState(self, gameState):
+    start = time.perf_counter()
+    self.red = gameState.isOnRedTeam(self.index)
+    self.agentTime += time.perf_counter() - start
+
+  def chooseAction(self, gameState):
+    start = time.perf_counter()
+    action = self.random.choice(gameState.getLegalActions(self.index))
+    self.agentTime += time.perf_counter() - start
+    return action
+
+def _measureGameOverhead(l, catchExceptions, length = 1200):
+  import textDisplay
+  agents = [TimedRandomAgent(i) for i in range(4)]
+  rules = capture.CaptureRules(quiet = True)
+  import io, contextlib
+  with contextlib.redirect_stdout(io.StringIO()):
+    game = rules.newGame(l, agents, textDisplay.NullGraphics(), length, False, catchExceptions)
+    start = time.perf_counter()
+    game.run()
+    elapsed = time.perf_counter() - start
+  agentTime = sum(agent.agentTime for agent in agents)
+  return (elapsed - agentTime) / len(game.moveHistory), len(game.moveHistory)
+
+def benchmarkGameOverhead(names, repeat = 3):
+  """
+  Time per move that Game.run spends outside the agents' own decision code
+  (observations, copies, successor generation, rules and timeouts), with
+  and without catchExceptions.
+  """
+  rows = []
+  for name, l in getLayouts(names):
+    plain = min(_measureGameOverhead(l, False)[0] for i in range(repeat))
+    timed, moves = min(_measureGameOverhead(l, True) for i in range(repeat))
+    rows.append([name, moves, '%.1f' % (plain * 1e6), '%.1f' % (timed * 1e6)])
+  printTable(['layout', 'moves', 'us/move', 'us/move(-c)'], rows)
+
+##########
+# Search #
+##########
+
+def _alphaBeta(state, agentIndex, plies, alpha, beta, inPlace, nodes):
+  """
+  Plain alpha-beta over all four agents in turn, maximizing for red, with
+  a cheap evaluation of the score and agent positions.  Successors are
+  either new states from generateSuccessor or the same state moved with
+  applyAction/undoAction.
+  """
+  nodes[0] += 1
+  if plies == 0 or state.isOver():
+    positions = [state.getAgentPosition(i) for i in range(state.getNumAgents())]
+    return 100 * state.getScore() + sum((i + 1) * x * y % 7 for i, (x, y) in enumerate(positions))
+  nextIndex = (agentIndex + 1) % state.getNumAgents()
+  maximize = state.isOnRedTeam(agentIndex)
+  best = -sys.maxsize if maximize else sys.maxsize
+  for action in state.getLegalActions(agentIndex):
+    if inPlace:
+      undo = state.applyAction(agentIndex, action)
+      value = _alphaBeta(state, nextIndex, plies - 1, alpha, beta, inPlace, nodes)
+      state.undoAction(undo)
+    else:
+      successor = state.generateSuccessor(agentIndex, action)
+      value = _alphaBeta(successor, nextIndex, plies - 1, alpha, beta, inPlace, nodes)
+    if maximize:
+      best = max(best, value)
+      alpha = max(alpha, best)
+    else:
+      best = min(best, value)
+      beta = min(beta, best)
+    if beta <= alpha:
+      break
+  return best
+
+def _searchRate(l, plies, inPlace):
+  state = capture.GameState()
+  state.initialize(l, 4)
+  state.data.timeleft = 1200
+  nodes = [0]
+  searches = 0
+  start = time.perf_counter()
+  # repeat the search so that small trees are still timed reliably
+  while searches == 0 or time.perf_counter() - start < 0.5:
+    _alphaBeta(state, 0, plies, -sys.maxsize, sys.maxsize, inPlace, nodes)
+    searches += 1
+  return nodes[0] // searches, nodes[0] / (time.perf_counter() - start)
+
+def benchmarkSearch(names, plies = 8):
+  """
+  Alpha-beta nodes per second at equal depth when every node is a new
+  GameState (generateSuccessor) versus one state changed in place
+  (applyAction/undoAction).
+  """
+  rows = []
+  for name, l in getLayouts(names):
+    nodes, copyRate = _searchRate(l, plies, False)
+    _, inPlaceRate = _searchRate(l, plies, True)
+    rows.append([name, plies, nodes, '%.0f' % copyRate, '%.0f' % inPlaceRate, '%.2fx' % (inPlaceRate / copyRate)])
+  printTable(['layout', 'plies', 'nodes', 'copy(n/s)', 'in-place(n/s)', 'speedup'], rows)
+
+  # Both ways run the same rules, so the rules alone bound the speedup
+  print('')
+  rows = []
+  for name, l in getLayouts(names):
+    copyCost, inPlaceCost, rulesCost = _moveCosts(l)
+    rows.append([name, '%.2f' % (copyCost * 1e6), '%.2f' % (inPlaceCost * 1e6), '%.2f' % (rulesCost * 1e6),
+                 '%.2fx' % (copyCost / inPlaceCost), '%.2fx' % (copyCost / rulesCost)])
+  printTable(['layout', 'successor(us)', 'apply+undo(us)', 'rules(us)', 'speedup', 'bound'], rows)
+
+def _moveCosts(l, moves = 500, seed = 1):
+  """
+  Seconds per move along a random game for generateSuccessor, for
+  applyAction with undoAction, and for the AgentRules calls both make.
+  """
+  import random
+  rng = random.Random(seed)
+  state = capture.GameState()
+  state.initialize(l, 4)
+  state.data.timeleft = 1200
+  positions = []
+  for i in range(moves):
+    index = i % 4
+    action = rng.choice(state.getLegalActions(index))
+    positions.append((state, index, action))
+    state = state.generateSuccessor(index, action)
+
+  def successors():
+    for state, index, action in positions:
+      state.generateSuccessor(index, action)
+  copies = [(state.deepCopy(), index, action) for state, index, action in positions]
+  def inPlace():
+    for state, index, action in copies:
+      state.undoAction(state.applyAction(index, action))
+  def rules():
+    # each copy is used once, so the rules change states nobody reads again
+    for state, index, action in [(state.deepCopy(), index, action) for state, index, action in positions]:
+      start = time.perf_counter()
+      capture.AgentRules.applyAction(state, action, index)
+      capture.AgentRules.checkDeath(state, index)
+      capture.AgentRules.decrementTimer(state.data.agentStates[index], state, index)
+      elapsed[0] += time.perf_counter() - start
+  costs = []
+  for play in [successors, inPlace]:
+    best = None
+    for i in range(5):
+      start = time.perf_counter()
+      play()
+      t = time.perf_counter() - start
+      best = t if best is None else min(best, t)
+    costs.append(best / moves)
+  best = None
+  for i in range(5):
+    elapsed = [0.0]
+    rules()
+    best = elapsed[0] if best is None else min(best, elapsed[0])
+  costs.append(best / moves)
+  return costs
+
+############
+# Features #
+############
+
+def _searchPositions(l, count, seed = 1):
+  "States from a seeded random playout, taken when agent 0 is to move."
+  import random
+  rng = random.Random(seed)
+  state = capture.GameState()
+  state.initialize(l, 4)
+  state.data.timeleft = 1200
+  positions = []
+  index = 0
+  while len(positions) < count and not state.isOver():
+    if index == 0: positions.append(state)
+    state = state.generateSuccessor(index, rng.choice(state.getLegalActions(index)))
+    index = (index + 1) % state.getNumAgents()
+  return positions
+
+def _evaluatePositions(agentClass, positions, depth, profile = False):
+  agent = agentClass(0)
+  agent.profileFeatures = profile
+  agent.registerInitialState(positions[0].deepCopy())
+  agent.depth = depth
+  start = time.perf_counter()
+  for state in positions:
+    # as in chooseAction: fresh search, food field built once per move
+    agent.transpositionTable.newSearch()
+    agent.getFoodDistances(state)
+    for action in state.getLegalActions(agent.index):
+      agent.evaluate(state, action)
+  return time.perf_counter() - start, agent
+
+def benchmarkFeatures(names, depth = 2, moves = 20):
+  """
+  AttackAgent's fixed-depth search from the states of a random playout:
+  time per evaluated leaf when getWeights computes the features again versus
+  when both share the feature cache, followed by the cost of each feature
+  per leaf.
+  """
+  import myTeam
+  class UncachedAttackAgent(myTeam.AttackAgent):
+    def getFeatures(self, state, index):
+      return self.computeFeatures(state, index)
+
+  rows = []
+  profiles = []
+  for name, l in getLayouts(names):
+    positions = _searchPositions(l, moves)
+    uncachedTime, uncached = _evaluatePositions(UncachedAttackAgent, positions, depth)
+    cachedTime, cached = _evaluatePositions(myTeam.AttackAgent, positions, depth)
+    leaves = cached.leavesEvaluated
+    rows.append([name, depth, leaves, '%.1f' % (uncachedTime / uncached.leavesEvaluated * 1e6),
+                 '%.1f' % (cachedTime / leaves * 1e6), '%.2fx' % (uncachedTime / cachedTime)])
+    _, profiled = _evaluatePositions(myTeam.AttackAgent, positions, depth, profile = True)
+    total = sum(profiled.featureProfile.values())
+    for feature, seconds in profiled.featureProfile.items():
+      profiles.append([name, feature, '%.2f' % (seconds / profiled.leavesEvaluated * 1e6), '%.0f%%' % (100 * seconds / total)])
+  printTable(['layout', 'depth', 'leaves', 'uncached(us/leaf)', 'cached(us/leaf)', 'speedup'], rows)
+  print('')
+  printTable(['layout', 'feature', 'us/leaf', 'share'], profiles)
+
+#################
+# Legal actions #
+#################
+
+def legacyGetLegalActions(state, agentIndex):
+  """
+  The original AgentRules.getLegalActions: round the position, check the
+  half-step tolerance and test the walls around the agent on every call.
+  Kept here as the reference point for the legalActions benchmark.
+  """
+  from game import Actions
+  agentState = state.getAgentState(agentIndex)
+  possibleActions = Actions.getPossibleActions(agentState.configuration, state.data.layout.walls)
+  return capture.AgentRules.filterForAllowedActions(agentState, possibleActions)
+
+def _legalActionRate(getLegalActions, states):
+  calls = 0
+  start = time.perf_counter()
+  while calls == 0 or time.perf_counter() - start < 0.2:
+    for state in states:
+      getLegalActions(state, 0)
+    calls += len(states)
+  return calls / (time.perf_counter() - start)
+
+def benchmarkLegalActions(names):
+  """
+  getLegalActions calls per second with agent 0 on every open cell: the
+  original wall tests versus the layout's legal action table, both as the
+  list getLegalActions returns and as the tuple the rules use internally.
+  """
+  from game import Configuration, Directions
+  rows = []
+  for name, l in getLayouts(names):
+    base = capture.GameState()
+    base.initialize(l, 4)
+    base.data.timeleft = 1200
+    l.getLegalActionTable()
+    states = []
+    for cell in l.walls.asList(False):
+      state = base.deepCopy()
+      state.data.agentStates[0].configuration = Configuration(cell, Directions.STOP)
+      states.append(state)
+    legacy = _legalActionRate(legacyGetLegalActions, states)
+    table = _legalActionRate(capture.AgentRules.getLegalActions, states)
+    internal = _legalActionRate(capture.AgentRules.legalActionTuple, states)
+    rows.append([name, len(states), '%.0f' % legacy, '%.0f' % table, '%.0f' % internal,
+                 '%.2fx' % (table / legacy), '%.2fx' % (internal / legacy)])
+  printTable(['layout', 'cells', 'legacy(calls/s)', 'table(calls/s)', 'tuple(calls/s)', 'speedup', 'speedup(tuple)'], rows)
+
+###############
+# Allocations #
+###############
+
+class LegacyConfiguration:
+  "game.Configuration as it was before __slots__, for the allocations benchmark"
+  def __init__(self, pos, direction):
+    self.pos = pos
+    self.direction = direction
+
+  def getPosition(self):
+    return self.pos
+
+  def getDirection(self):
+    return self.direction
+
+  def __eq__(self, other):
+    if other == None: return False
+    return self.pos == other.pos and self.direction == other.direction
+
+  def __hash__(self):
+    return hash(hash(self.pos) + 13 * hash(self.direction))
+
+  def generateSuccessor(self, vector):
+    from game import Actions, Directions
+    x, y = self.pos
+    dx, dy = vector
+    direction = Actions.vectorToDirection(vector)
+    if direction == Directions.STOP:
+      direction = self.direction
+    return LegacyConfiguration((x + dx, y + dy), direction)
+
+class LegacyAgentState:
+  "game.AgentState as it was before __slots__, for the allocations benchmark"
+  def __init__(self, startConfiguration, isPacman):
+    self.start = startConfiguration
+    self.configuration = startConfiguration
+    self.isPacman = isPacman
+    self.scaredTimer = 0
+    self.numCarrying = 0
+    self.numReturned = 0
+
+  def __eq__(self, other):
+    if other == None: return False
+    return self.configuration == other.configuration and self.scaredTimer == other.scaredTimer
+
+  def __hash__(self):
+    return hash(hash(self.configuration) + 13 * hash(self.scaredTimer))
+
+  def copy(self):
+    state = LegacyAgentState(self.start, self.isPacman)
+    state.configuration = self.configuration
+    state.scaredTimer = self.scaredTimer
+    state.numCarrying = self.numCarrying
+    state.numReturned = self.numReturned
+    return state
+
+  def getPosition(self):
+    if self.configuration == None: return None
+    return self.configuration.getPosition()
+
+  def getDirection(self):
+    return self.configuration.getDirection()
+
+def _legacyState(state):
+  "A copy of state whose agents are LegacyAgentStates"
+  state = state.deepCopy()
+  agentStates = []
+  for s in state.data.agentStates:
+    legacy = LegacyAgentState(LegacyConfiguration(s.start.pos, s.start.direction), s.isPacman)
+    legacy.configuration = LegacyConfiguration(s.configuration.pos, s.configuration.direction)
+    agentStates.append(legacy)
+  state.data.agentStates = agentStates
+  return state
+
+def _successorCost(state, moves = 2000, seed = 1):
+  """
+  Plays random moves from state, keeping every successor, and returns the
+  time, memory blocks and bytes per generateSuccessor call.
+  """
+  import random, tracemalloc, gc
+  rng = random.Random(seed)
+  actions = []
+  s, index = state, 0
+  for i in range(moves):
+    action = rng.choice(s.getLegalActions(index))
+    actions.append((index, action))
+    s = s.generateSuccessor(index, action)
+    index = (index + 1) % s.getNumAgents()
+  start = time.perf_counter()
+  s = state
+  for index, action in actions:
+    s = s.generateSuccessor(index, action)
+  elapsed = time.perf_counter() - start
+  gc.collect()
+  tracemalloc.start()
+  before = tracemalloc.take_snapshot()
+  kept = [state]
+  for index, action in actions:
+    kept.append(kept[-1].generateSuccessor(index, action))
+  after = tracemalloc.take_snapshot()
+  tracemalloc.stop()
+  stats = after.compare_to(before, 'filename')
+  blocks = sum(stat.count_diff for stat in stats)
+  size = sum(stat.size_diff for stat in stats)
+  return elapsed / moves, blocks / float(moves), size / float(moves)
+
+def benchmarkAllocations(names):
+  """
+  Cost of each generateSuccessor call (time, memory blocks and bytes kept
+  per successor) with dict-backed agent states and configurations, as
+  before, versus the __slots__ classes of game.py.
+  """
+  import timeit
+  rows = []
+  for name, l in getLayouts(names):
+    state = capture.GameState()
+    state.initialize(l, 4)
+    state.data.timeleft = 1200
+    legacy = _legacyState(state)
+    oldTime, oldBlocks, oldBytes = _successorCost(legacy)
+    newTime, newBlocks, newBytes = _successorCost(state)
+    rows.append([name, '%.2f' % (oldTime * 1e6), '%.2f' % (newTime * 1e6),
+                 '%.1f' % oldBlocks, '%.1f' % newBlocks, '%.0f' % oldBytes, '%.0f' % newBytes])
+  printTable(['layout', 'dict(us)', 'slots(us)', 'dict(blocks)', 'slots(blocks)', 'dict(bytes)', 'slots(bytes)'], rows)
+  agent = state.data.agentStates[0]
+  oldCopy = min(timeit.repeat(lambda: legacy.data.agentStates[0].copy(), number = 100000, repeat = 3)) / 100000
+  newCopy = min(timeit.repeat(agent.copy, number = 100000, repeat = 3)) / 100000
+  print('')
+  print('AgentState.copy: %.3f us with a __dict__, %.3f us with __slots__' % (oldCopy * 1e6, newCopy * 1e6))
+
+####################
+# Batch evaluation #
+####################
+
+def _reflexEvaluation(agent, positions):
+  "Seconds spent scoring the legal actions of every position"
+  start = time.perf_counter()
+  for state in positions:
+    agent.evaluateActions(state, state.getLegalActions(agent.index))
+  return time.perf_counter() - start
+
+def _scoringRate(rows, weights, batch, batched):
+  from captureAgents import scoreFeatures
+  batches = [rows[i:i + batch] for i in range(0, len(rows) - batch + 1, batch)]
+  start = time.perf_counter()
+  for rowsOfBatch in batches:
+    if batched:
+      scoreFeatures(rowsOfBatch, weights)
+    else:
+      [row * weights for row in rowsOfBatch]
+  return (time.perf_counter() - start) / (len(batches) * batch)
+
+def benchmarkBatchEvaluation(names, moves = 50):
+  """
+  Reflex evaluation with each action scored on its own (Counter * dict)
+  versus BatchEvaluationMixin (one matrix product per move), for the
+  baseline reflex agents; then the scoring step alone over batches of
+  feature rows of growing size, as for the leaves of a search.
+  """
+  import baselineTeam
+  from captureAgents import BatchEvaluationMixin, numpy
+  if numpy is None: print('numpy is not installed: batches are scored row by row')
+  rows = []
+  featureRows = []
+  for name, l in getLayouts(names):
+    positions = _searchPositions(l, moves)
+    for agentClass in [baselineTeam.OffensiveReflexAgent, baselineTeam.DefensiveReflexAgent]:
+      batchedClass = type('Batched' + agentClass.__name__, (BatchEvaluationMixin, agentClass), {})
+      times = []
+      for cls in [agentClass, batchedClass]:
+        agent = cls(0)
+        agent.registerInitialState(positions[0].deepCopy())
+        times.append(min(_reflexEvaluation(agent, positions) for i in range(3)))
+      rows.append([name, agentClass.__name__, '%.1f' % (times[0] / len(positions) * 1e6),
+                   '%.1f' % (times[1] / len(positions) * 1e6), '%.2fx' % (times[0] / times[1])])
+      if agentClass is baselineTeam.OffensiveReflexAgent:
+        for state in positions:
+          featureRows.extend(agent.getFeatures(state, action) for action in state.getLegalActions(0))
+        weights = agent.getWeights(positions[0], 'Stop')
+  printTable(['layout', 'agent', 'each(us/move)', 'batched(us/move)', 'speedup'], rows)
+
+  print('')
+  scoring = []
+  featureRows = (featureRows * (5000 // len(featureRows) + 1))[:5000]
+  for batch in [5, 50, 500, 5000]:
+    each = min(_scoringRate(featureRows, weights, batch, False) for i in range(3))
+    batched = min(_scoringRate(featureRows, weights, batch, True) for i in range(3))
+    scoring.append([batch, '%.2f' % (each * 1e6), '%.2f' % (batched * 1e6), '%.2fx' % (each / batched)])
+  printTable(['batch', 'each(us/row)', 'batched(us/row)', 'speedup'], scoring)
+
+#############
+# Simulator #
+#############
+
+def _replayRate(games, play):
+  "Moves per second of play(start, moves) over (start, moves) games"
+  start = time.perf_counter()
+  for game in games:
+    play(*game)
+  return sum(len(moves) for state, moves in games) / (time.perf_counter() - start)
+
+def benchmarkSimulator(names, numGames = 5):
+  """
+  Moves per second playing random games (see captureSimulator.randomGame)
+  with GameState.generateSuccessor, with GameState.applyAction in place,
+  and with the array-backed captureSimulator.Simulator.
+  """
+  import captureSimulator
+  from captureReplay import ACTION_CODES
+  def successors(state, moves):
+    for index, action in moves:
+      state = state.generateSuccessor(index, action)
+  def inPlace(state, moves):
+    state = state.deepCopy()
+    for index, action in moves:
+      state.applyAction(index, action)
+  rows = []
+  for name, l in getLayouts(names):
+    games = [captureSimulator.randomGame(l, seed) for seed in range(numGames)]
+    sim = captureSimulator.Simulator(games[0][0])
+    codes = [(state, [(index, ACTION_CODES[action]) for index, action in moves]) for state, moves in games]
+    def simulated(state, moves):
+      state = sim.fromGameState(state)
+      for index, action in moves:
+        sim.step(state, index, action)
+    rates = [max(_replayRate(g, play) for i in range(3))
+             for g, play in [(games, successors), (games, inPlace), (codes, simulated)]]
+    rows.append([name, '%.0f' % rates[0], '%.0f' % rates[1], '%.0f' % rates[2],
+                 '%.1fx' % (rates[2] / rates[0]), '%.1fx' % (rates[2] / rates[1])])
+  printTable(['layout', 'successor(moves/s)', 'inPlace(moves/s)', 'simulator(moves/s)', 'speedup', 'speedup(inPlace)'], rows)
+
+BENCHMARKS = {
+  'distances': benchmarkDistances,
+  'sharedDistances': benchmarkSharedDistances,
+  'gameOverhead': benchmarkGameOverhead,
+  'search': benchmarkSearch,
+  'features': benchmarkFeatures,
+  'legalActions': benchmarkLegalActions,
+  'allocations': benchmarkAllocations,
+  'batchEvaluation': benchmarkBatchEvaluation,
+  'simulator': benchmarkSimulator,
+}
+
+def readCommand(argv):
+  from optparse import OptionParser
+  usageStr = """
+  USAGE:      python benchmarks.py <benchmark> <options>
+  BENCHMARKS: %s
+  """ % ', '.join(sorted(BENCHMARKS))
+  parser = OptionParser(usageStr)
+  parser.add_option('-l', '--layouts', default='',
+                    help='Comma separated layouts to benchmark (RANDOM<seed> allowed) [Default: every layout in layouts/]')
+  options, args = parser.parse_args(argv)
+  if len(args) != 1 or args[0] not in BENCHMARKS:
+    parser.error('Choose one benchmark from: ' + ', '.join(sorted(BENCHMARKS)))
+  names = [name for name in options.layouts.split(',') if name]
+  return BENCHMARKS[args[0]], names
+
+if __name__ == '__main__':
+  benchmark, names = readCommand(sys.argv[1:])
+  benchmark(names)
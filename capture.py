@@ -55,10 +55,12 @@ from game import Actions
 from util import nearestPoint
 from util import manhattanDistance
 from game import Grid
+from game import BitGrid
 from game import Configuration
 from game import Agent
 from game import reconstituteGrid
 import sys, util, types, time, random, imp
+import distanceCalculator
 import keyboardAgents
 
 # If you change these, you won't affect the server, so you can't cheat
@@ -118,7 +120,7 @@ class GameState:
     # Find appropriate rules for the agent
     AgentRules.applyAction( state, action, agentIndex )
     AgentRules.checkDeath(state, agentIndex)
-    AgentRules.decrementTimer(state.data.agentStates[agentIndex])
+    AgentRules.decrementTimer(state.data.agentStates[agentIndex], state, agentIndex)
 
     # Book keeping
     state.data._agentMoved = agentIndex
@@ -126,6 +128,59 @@ class GameState:
     state.data.timeleft = self.data.timeleft - 1
     return state
 
+  def applyAction( self, agentIndex, action ):
+    """
+    Makes the specified agent take the action in this state, changing it in
+    place to exactly what generateSuccessor would return, and returns an
+    undo record.  Passing the record to undoAction restores the state, so
+    search code can walk the game tree on a single state:
+
+      undo = state.applyAction( index, action )
+      ... evaluate state ...
+      state.undoAction( undo )
+
+    Moves must be undone in the reverse order they were applied.  Read-only
+    states (see readOnlyView) cannot be changed; search on a deepCopy.
+
+    The record keeps the agent states themselves rather than their fields:
+    the moving agent is replaced by a copy here, and the rules copy any
+    other agent before changing it (see AgentRules.changeAgent), so the
+    agents the move leaves alone are never copied.
+    """
+    if self.readOnly: raise Exception('Cannot apply an action to a read-only state; deepCopy it first')
+    data = self.data
+    agentStates = data.agentStates
+    undo = (data.food, data.capsules, data.score, data.scoreChange, data.timeleft,
+            data._win, data._lose, data._agentMoved, data._foodEaten, data._foodAdded, data._capsuleEaten,
+            self.zobrist, self.foodDistances, agentStates[:])
+    agentStates[agentIndex] = agentStates[agentIndex].copy()
+    data.scoreChange = 0
+    data._win = data._lose = False
+    data._foodEaten = data._foodAdded = data._capsuleEaten = None
+
+    # Same rules as generateSuccessor
+    AgentRules.applyAction( self, action, agentIndex )
+    AgentRules.checkDeath(self, agentIndex)
+    AgentRules.decrementTimer(data.agentStates[agentIndex], self, agentIndex)
+
+    # Book keeping
+    data._agentMoved = agentIndex
+    data.score += data.scoreChange
+    data.timeleft -= 1
+    return undo
+
+  def undoAction( self, undo ):
+    """
+    Restores the state to what it was before the applyAction call that
+    returned the undo record.
+    """
+    if self.readOnly: raise Exception('Cannot undo an action on a read-only state')
+    data = self.data
+    (data.food, data.capsules, data.score, data.scoreChange, data.timeleft,
+     data._win, data._lose, data._agentMoved, data._foodEaten, data._foodAdded, data._capsuleEaten,
+     self.zobrist, self.foodDistances, agentStates) = undo
+    data.agentStates[:] = agentStates
+
   def getAgentState(self, index):
     return self.data.agentStates[index]
 
@@ -149,6 +204,33 @@ class GameState:
     """
     return self.data.score
 
+  def getFoodDistances( self, red ):
+    fields = self.foodDistances or (None, None)
+    field = fields[red]
+    if field is None:
+      walls = self.data.layout.walls
+      food = halfGrid(self.data.food, red)
+      field = distanceCalculator.DistanceField(walls, food.asList(), distanceCalculator.distanceMap.get(walls))
+      if red: self.foodDistances = (fields[0], field)
+      else: self.foodDistances = (field, fields[1])
+    return field
+
+  def getZobristHash( self ):
+    """
+    Returns a 64-bit Zobrist hash of the agent positions, modes, scared
+    timers and carried/returned food, plus the food and capsules left.
+    It is computed in full on the first call and then kept up to date by
+    the rules as successors are generated, so it costs O(1) per move and
+    makes a good key for search caches such as util.TranspositionTable.
+
+    Unlike __hash__, it ignores the score, the agents' directions and the
+    time left.  Its keys depend only on the layout size (see ZobristTables),
+    so a hash is only meaningful next to hashes of states on the same layout.
+    """
+    if self.zobrist is None:
+      self.zobrist = zobristHash(self)
+    return self.zobrist
+
   def getRedFood(self):
     """
     Returns a matrix of food that corresponds to the food on the red team's side.
@@ -165,6 +247,22 @@ class GameState:
     """
     return halfGrid(self.data.food, red = False)
 
+  def getRedFoodDistances(self):
+    """
+    Returns a distanceCalculator.DistanceField: for a position p, m[p] is
+    the maze distance from p to the nearest red food (the food blue is
+    trying to eat), or sys.maxsize if none is left.  The field is built on
+    first use and then kept up to date in successor states as food is
+    eaten or dropped, so reading it is O(1).
+    """
+    return self.getFoodDistances(red = True)
+
+  def getBlueFoodDistances(self):
+    """
+    Like getRedFoodDistances, for the blue food (the food red is trying to eat).
+    """
+    return self.getFoodDistances(red = False)
+
   def getRedCapsules(self):
     return halfList(self.data.capsules, self.data.food, red = True)
 
@@ -256,9 +354,15 @@ class GameState:
 
       self.teams = prevState.teams
       self.agentDistances = prevState.agentDistances
+      self.zobrist = prevState.zobrist
+      self.foodDistances = prevState.foodDistances
     else:
       self.data = GameStateData()
       self.agentDistances = []
+      self.zobrist = None
+      # (blue, red) food DistanceFields, made on demand; see getFoodDistances
+      self.foodDistances = None
+    self.readOnly = False
 
   def deepCopy( self ):
     state = GameState( self )
@@ -271,8 +375,34 @@ class GameState:
     state.agentDistances = self.agentDistances[:]
     return state
 
+  def readOnlyView( self ):
+    """
+    Returns a copy-on-write view of this state for an agent to observe.  It
+    has its own GameStateData, so the agent may change its agent states,
+    food and capsules without touching this state, but the copy is shallow:
+    the food BitGrid only wraps an immutable integer, the agent states are
+    small slotted objects and the layout and food distance fields are
+    shared, the fields being replaced rather than changed when food moves.
+    Views cannot be changed through applyAction/undoAction; reading them,
+    generateSuccessor and deepCopy all work as usual and return ordinary
+    states, so an agent that wants to search in place copies a view first.
+    """
+    state = GameState.__new__(GameState)
+    state.__dict__.update(self.__dict__)
+    data = self.data
+    state.data = view = GameStateData(data)
+    view.timeleft = data.timeleft
+    view.scoreChange = data.scoreChange
+    view._win, view._lose = data._win, data._lose
+    view._agentMoved = data._agentMoved
+    view._foodEaten, view._foodAdded, view._capsuleEaten = data._foodEaten, data._foodAdded, data._capsuleEaten
+    state.readOnly = True
+    return state
+
   def makeObservation(self, index):
-    state = self.deepCopy()
+    # Nothing is hidden from agents (see below), so the observation is a
+    # copy-on-write view rather than a deep copy
+    state = self.readOnlyView()
 
     # ***BEGIN REMOVED FOR CONTEST 2***
     # # Adds the sonar signal
@@ -296,6 +426,7 @@ class GameState:
     #     if util.manhattanDistance(enemyPos, state.getAgentPosition(teammate)) <= SIGHT_RANGE:
     #       seen = True
     #   if not seen: state.data.agentStates[enemy].configuration = None
+    # state.zobrist = None
     # ***END REMOVED FOR CONTEST 2***
     return state
 
@@ -321,6 +452,8 @@ class GameState:
     Creates an initial game state from a layout array (see layout.py).
     """
     self.data.initialize(layout, numAgents)
+    self.zobrist = None
+    self.foodDistances = None
     positions = [a.configuration for a in self.data.agentStates]
     self.blueTeam = [i for i,p in enumerate(positions) if not self.isRed(p)]
     self.redTeam = [i for i,p in enumerate(positions) if self.isRed(p)]
@@ -337,8 +470,118 @@ class GameState:
     else:
       return configOrPos.pos[0] < width / 2
 
+# Zobrist keys are fixed per layout size: each component of an agent (its
+# position, mode, scared timer and carried/returned food) has its own table,
+# so the number of keys never grows as games are played.
+ZOBRIST_TABLES = {}
+
+class ZobristTables:
+  """
+  The random 64-bit keys for one layout size and number of agents.  They
+  are drawn from a private generator seeded by the size, so hashing never
+  disturbs the game's own random sequence and the same layout always gets
+  the same keys.
+  """
+  def __init__( self, width, height, numAgents ):
+    rand = random.Random('zobrist %d %d %d' % (width, height, numAgents))
+    keys = lambda n: [rand.getrandbits(64) for i in range(n)]
+    cells = width * height
+    self.height = height
+    self.food = keys(cells)
+    self.capsule = keys(cells)
+    self.position = [keys(cells) for i in range(numAgents)]
+    self.pacman = keys(numAgents)
+    self.scared = [keys(SCARED_TIME + 1) for i in range(numAgents)]
+    # no agent can carry or return more food than there are cells
+    self.carrying = [keys(cells + 1) for i in range(numAgents)]
+    self.returned = [keys(cells + 1) for i in range(numAgents)]
+    self.turn = keys(numAgents)
+    self.over = rand.getrandbits(64)
+
+  def agentKey( self, agentIndex, agentState ):
+    key = (self.scared[agentIndex][min(agentState.scaredTimer, SCARED_TIME)] ^
+           self.carrying[agentIndex][min(agentState.numCarrying, len(self.carrying[agentIndex]) - 1)] ^
+           self.returned[agentIndex][min(agentState.numReturned, len(self.returned[agentIndex]) - 1)])
+    if agentState.isPacman:
+      key ^= self.pacman[agentIndex]
+    position = agentState.getPosition()
+    if position is not None:
+      key ^= self.position[agentIndex][int(position[0]) * self.height + int(position[1])]
+    return key
+
+def zobristTables(state):
+  """
+  Returns the ZobristTables for a state's layout, building them on first use.
+  """
+  layout = state.data.layout
+  size = (layout.width, layout.height, len(state.data.agentStates))
+  tables = ZOBRIST_TABLES.get(size)
+  if tables is None:
+    tables = ZOBRIST_TABLES[size] = ZobristTables(*size)
+  return tables
+
+def zobristHash(state):
+  """
+  Computes the Zobrist hash of a state from scratch.
+  """
+  tables = zobristTables(state)
+  h = 0
+  for agentIndex, agentState in enumerate(state.data.agentStates):
+    h ^= tables.agentKey(agentIndex, agentState)
+  for x, y in state.data.food.asList():
+    h ^= tables.food[x * tables.height + y]
+  for x, y in state.data.capsules:
+    h ^= tables.capsule[x * tables.height + y]
+  return h
+
+def toggleZobristFood(state, x, y):
+  """
+  Adds food at (x, y) to the state's hash, or removes it if it was there.
+  Rule code calls this whenever food is eaten or dropped.
+  """
+  if state.zobrist is not None:
+    tables = zobristTables(state)
+    state.zobrist ^= tables.food[x * tables.height + y]
+
+def toggleZobristCapsule(state, x, y):
+  if state.zobrist is not None:
+    tables = zobristTables(state)
+    state.zobrist ^= tables.capsule[x * tables.height + y]
+
+def toggleZobristAgent(state, agentIndex):
+  """
+  Adds an agent's current state to the hash, or removes it.  Rule code calls
+  this before and after changing an agent.
+  """
+  if state.zobrist is not None:
+    state.zobrist ^= zobristTables(state).agentKey(agentIndex, state.data.agentStates[agentIndex])
+
+def updateFoodDistances(state, position, eaten):
+  """
+  Keeps the state's food DistanceFields in step when food appears or is
+  eaten at position.  Fields may be shared with other states, so the one
+  that changes is copied first.
+  """
+  if state.foodDistances is None:
+    return
+  red = position[0] < state.data.layout.width // 2
+  field = state.foodDistances[red]
+  if field is None:
+    return
+  field = field.copy()
+  if eaten:
+    field.removeSource(position)
+  else:
+    field.addSource(position)
+  if red: state.foodDistances = (state.foodDistances[0], field)
+  else: state.foodDistances = (field, state.foodDistances[1])
+
 def halfGrid(grid, red):
   halfway = grid.width // 2
+  if isinstance(grid, BitGrid):
+    redBits = (1 << (halfway * grid.height)) - 1
+    if red: return grid.mask(redBits)
+    return grid.mask(((1 << (grid.width * grid.height)) - 1) ^ redBits)
   halfgrid = Grid(grid.width, grid.height, False)
   if red:    xrange = list(range(halfway))
   else:       xrange = list(range(halfway, grid.width))
@@ -377,6 +620,7 @@ class CaptureRules:
   def newGame( self, layout, agents, display, length, muteAgents, catchExceptions ):
     initState = GameState()
     initState.initialize( layout, len(agents) )
+    layout.getLegalActionTable()
     starter = random.randint(0,1)
     print(('%s team starts' % ['Red', 'Blue'][starter]))
     game = Game(agents, display, self, startingIndex=starter, muteAgents=muteAgents, catchExceptions=catchExceptions)
@@ -462,11 +706,24 @@ class AgentRules:
     """
     Returns a list of legal actions (which are both possible & allowed)
     """
-    agentState = state.getAgentState(agentIndex)
+    return list( AgentRules.legalActionTuple( state, agentIndex ) )
+  getLegalActions = staticmethod( getLegalActions )
+
+  def legalActionTuple( state, agentIndex ):
+    """
+    The legal actions as a tuple that must not be changed, looked up in the
+    layout's table (see Layout.getLegalActionTable) for agents on a cell.
+    """
+    agentState = state.data.agentStates[agentIndex]
     conf = agentState.configuration
-    possibleActions = Actions.getPossibleActions( conf, state.data.layout.walls )
+    layout = state.data.layout
+    table = layout.legalActions or layout.getLegalActionTable()
+    possibleActions = table.get(conf.pos)
+    if possibleActions is None:
+      # between cells
+      possibleActions = tuple( Actions.getPossibleActions( conf, layout.walls ) )
     return AgentRules.filterForAllowedActions( agentState, possibleActions)
-  getLegalActions = staticmethod( getLegalActions )
+  legalActionTuple = staticmethod( legalActionTuple )
 
   def filterForAllowedActions(agentState, possibleActions):
     return possibleActions
@@ -477,12 +734,13 @@ class AgentRules:
     """
     Edits the state to reflect the results of the action.
     """
-    legal = AgentRules.getLegalActions( state, agentIndex )
+    legal = AgentRules.legalActionTuple( state, agentIndex )
     if action not in legal:
       raise Exception("Illegal action " + str(action))
 
     # Update Configuration
     agentState = state.data.agentStates[agentIndex]
+    toggleZobristAgent(state, agentIndex)
     speed = 1.0
     # if agentState.isPacman: speed = 0.5
     vector = Actions.directionToVector( action, speed )
@@ -517,6 +775,7 @@ class AgentRules:
         if redCount >= (TOTAL_FOOD/2) - MIN_FOOD or blueCount >= (TOTAL_FOOD/2) - MIN_FOOD:
           state.data._win = True
 
+    toggleZobristAgent(state, agentIndex)
 
     if agentState.isPacman and manhattanDistance( nearest, next ) <= 0.9 :
       AgentRules.consume( nearest, state, state.isOnRedTeam(agentIndex) )
@@ -537,16 +796,21 @@ class AgentRules:
         teamIndicesFunc = state.getRedTeamIndices
 
       # go increase the variable for the pacman who ate this
-      agents = [state.data.agentStates[agentIndex] for agentIndex in teamIndicesFunc()]
-      for agent in agents:
+      for agentIndex in teamIndicesFunc():
+        agent = state.data.agentStates[agentIndex]
         if agent.getPosition() == position:
+          agent = AgentRules.changeAgent(state, agentIndex)
+          toggleZobristAgent(state, agentIndex)
           agent.numCarrying += 1
+          toggleZobristAgent(state, agentIndex)
           break # the above should only be true for one agent...
 
       # do all the score and food grid maintainenace
       #state.data.scoreChange += score
       state.data.food = state.data.food.copy()
       state.data.food[x][y] = False
+      toggleZobristFood(state, x, y)
+      updateFoodDistances(state, (x, y), eaten = True)
       state.data._foodEaten = position
       #if (isRed and state.getBlueFood().count() == MIN_FOOD) or (not isRed and state.getRedFood().count() == MIN_FOOD):
       #  state.data._win = True
@@ -555,22 +819,33 @@ class AgentRules:
     if isRed: myCapsules = state.getBlueCapsules()
     else: myCapsules = state.getRedCapsules()
     if( position in myCapsules ):
+      # copy first, the capsule list may be shared with other states
+      state.data.capsules = state.data.capsules[:]
       state.data.capsules.remove( position )
+      toggleZobristCapsule(state, x, y)
       state.data._capsuleEaten = position
 
       # Reset all ghosts' scared timers
       if isRed: otherTeam = state.getBlueTeamIndices()
       else: otherTeam = state.getRedTeamIndices()
       for index in otherTeam:
-        state.data.agentStates[index].scaredTimer = SCARED_TIME
+        toggleZobristAgent(state, index)
+        AgentRules.changeAgent(state, index).scaredTimer = SCARED_TIME
+        toggleZobristAgent(state, index)
 
   consume = staticmethod( consume )
 
-  def decrementTimer(state):
+  def decrementTimer(state, gameState=None, agentIndex=None):
     timer = state.scaredTimer
+    if timer <= 0:
+      return
+    # keep the game state's hash in step when one is given
+    if gameState is not None: toggleZobristAgent(gameState, agentIndex)
     if timer == 1:
-      state.configuration.pos = nearestPoint( state.configuration.pos )
-    state.scaredTimer = max( 0, timer - 1 )
+      # configurations are shared between states, so replace rather than edit
+      state.configuration = Configuration( nearestPoint( state.configuration.pos ), state.configuration.direction )
+    state.scaredTimer = timer - 1
+    if gameState is not None: toggleZobristAgent(gameState, agentIndex)
   decrementTimer = staticmethod( decrementTimer )
 
   def dumpFoodFromDeath(state, agentState, agentIndex):
@@ -661,6 +936,8 @@ class AgentRules:
       y = int(y)
       if (allGood(state, x, y)):
         state.data.food[x][y] = True
+        toggleZobristFood(state, x, y)
+        updateFoodDistances(state, (x, y), eaten = False)
         foodAdded.append((x, y))
         numToDump -= 1
 
@@ -689,6 +966,8 @@ class AgentRules:
         if manhattanDistance( ghostPosition, agentState.getPosition() ) <= COLLISION_TOLERANCE:
           # award points to the other team for killing Pacmen
           if otherAgentState.scaredTimer <= 0:
+            agentState = AgentRules.changeAgent(state, agentIndex)
+            toggleZobristAgent(state, agentIndex)
             AgentRules.dumpFoodFromDeath(state, agentState, agentIndex)
 
             score = KILL_POINTS
@@ -698,7 +977,10 @@ class AgentRules:
             agentState.isPacman = False
             agentState.configuration = agentState.start
             agentState.scaredTimer = 0
+            toggleZobristAgent(state, agentIndex)
           else:
+            otherAgentState = AgentRules.changeAgent(state, index)
+            toggleZobristAgent(state, index)
             score = KILL_POINTS
             if state.isOnRedTeam(agentIndex):
               score = -score
@@ -706,6 +988,7 @@ class AgentRules:
             otherAgentState.isPacman = False
             otherAgentState.configuration = otherAgentState.start
             otherAgentState.scaredTimer = 0
+            toggleZobristAgent(state, index)
     else: # Agent is a ghost
       for index in otherTeam:
         otherAgentState = state.data.agentStates[index]
@@ -715,6 +998,8 @@ class AgentRules:
         if manhattanDistance( pacPos, agentState.getPosition() ) <= COLLISION_TOLERANCE:
           #award points to the other team for killing Pacmen
           if agentState.scaredTimer <= 0:
+            otherAgentState = AgentRules.changeAgent(state, index)
+            toggleZobristAgent(state, index)
             AgentRules.dumpFoodFromDeath(state, otherAgentState, agentIndex)
 
             score = KILL_POINTS
@@ -724,7 +1009,10 @@ class AgentRules:
             otherAgentState.isPacman = False
             otherAgentState.configuration = otherAgentState.start
             otherAgentState.scaredTimer = 0
+            toggleZobristAgent(state, index)
           else:
+            agentState = AgentRules.changeAgent(state, agentIndex)
+            toggleZobristAgent(state, agentIndex)
             score = KILL_POINTS
             if state.isOnRedTeam(agentIndex):
               score = -score
@@ -732,8 +1020,19 @@ class AgentRules:
             agentState.isPacman = False
             agentState.configuration = agentState.start
             agentState.scaredTimer = 0
+            toggleZobristAgent(state, agentIndex)
   checkDeath = staticmethod( checkDeath )
 
+  def changeAgent(state, agentIndex):
+    """
+    Replaces an agent's state with a copy and returns the copy, for rules
+    that change an agent: GameState.applyAction keeps the states from
+    before the move in its undo record, so they must not be changed.
+    """
+    agentState = state.data.agentStates[agentIndex] = state.data.agentStates[agentIndex].copy()
+    return agentState
+  changeAgent = staticmethod( changeAgent )
+
   def placeGhost(state, ghostState):
     ghostState.configuration = ghostState.start
   placeGhost = staticmethod( placeGhost )
@@ -809,19 +1108,39 @@ def readCommand( argv ):
                     help=default('Number of games to play'), default=1)
   parser.add_option('-f', '--fixRandomSeed', action='store_true',
                     help='Fixes the random seed to always play the same game', default=False)
+  parser.add_option('--seed', type='int', default=None, metavar='SEED',
+                    help='Play game i with the random seed SEED + i, e.g. the seed of a --results line to play that game again')
   parser.add_option('--record', action='store_true',
                     help='Writes game histories to a file (named by the time they were played)', default=False)
   parser.add_option('--replay', default=None,
                     help='Replays a recorded game file.')
+  parser.add_option('--seek', type='int', default=0, metavar='MOVE',
+                    help=default('Start the replay after MOVE moves'))
   parser.add_option('-x', '--numTraining', dest='numTraining', type='int',
                     help=default('How many episodes are training (suppresses output)'), default=0)
   parser.add_option('-c', '--catchExceptions', action='store_true', default=False,
                     help='Catch exceptions and enforce time limits')
+  parser.add_option('--results', default=None, metavar='FILE',
+                    help='Append one JSON line per finished game to FILE')
+  parser.add_option('--metrics', default=None, metavar='FILE',
+                    help='Write latency histograms of agent calls and game steps to FILE when the games end')
+  parser.add_option('--metricsFormat', type='choice', choices=['json', 'prometheus'], default='json',
+                    help=default('Format of the --metrics file: json or prometheus'))
+  parser.add_option('--parallel', type='int', default=0, metavar='N',
+                    help='Play the games in N worker processes, each loading its own teams and seeding each game (needs -q or -Q)')
 
   options, otherjunk = parser.parse_args(argv)
   assert len(otherjunk) == 0, "Unrecognized options: " + str(otherjunk)
   args = dict()
 
+  if options.parallel > 0:
+    if not (options.quiet or options.super_quiet) or options.textgraphics:
+      parser.error('--parallel games have no display, use it with -q or -Q')
+    if options.keys0 or options.keys1 or options.keys2 or options.keys3:
+      parser.error('--parallel cannot be used with keyboard agents')
+    if options.numTraining > 0:
+      parser.error('--parallel cannot be used with training games')
+
   # Choose a display format
   #if options.pygame:
   #   import pygameDisplay
@@ -853,10 +1172,11 @@ def readCommand( argv ):
   # Special case: recorded games don't use the runGames method or args structure
   if options.replay != None:
     print('Replaying recorded game %s.' % options.replay)
-    import pickle
-    recorded = pickle.load(open(options.replay, 'rb'))
-    recorded['display'] = args['display']
-    replayGame(**recorded)
+    import captureReplay
+    replay = captureReplay.loadReplay(options.replay)
+    start = min(options.seek, len(replay.moves))
+    replayGame(replay.layout, [Agent(i) for i in range(replay.numAgents)], replay.moves, args['display'],
+               replay.length, replay.redTeamName, replay.blueTeamName, start, replay.stateAt(start))
     sys.exit(0)
 
   # Choose a pacman agent
@@ -866,14 +1186,21 @@ def readCommand( argv ):
     blueArgs['numTraining'] = options.numTraining
   nokeyboard = options.textgraphics or options.quiet or options.numTraining > 0
   print('\nRed team %s with %s:' % (options.red, redArgs))
-  redAgents = loadAgents(True, options.red, nokeyboard, redArgs)
-  print('\nBlue team %s with %s:' % (options.blue, blueArgs))
-  blueAgents = loadAgents(False, options.blue, nokeyboard, blueArgs)
-  args['agents'] = sum([list(el) for el in zip(redAgents, blueAgents)],[]) # list of agents
+  if options.parallel > 0:
+    # every game loads its own agents in a worker process
+    print('\nBlue team %s with %s:' % (options.blue, blueArgs))
+    args['agents'] = None
+    args['parallel'] = options.parallel
+    args['teams'] = (options.red, redArgs, options.blue, blueArgs)
+  else:
+    redAgents = loadAgents(True, options.red, nokeyboard, redArgs)
+    print('\nBlue team %s with %s:' % (options.blue, blueArgs))
+    blueAgents = loadAgents(False, options.blue, nokeyboard, blueArgs)
+    args['agents'] = sum([list(el) for el in zip(redAgents, blueAgents)],[]) # list of agents
 
   numKeyboardAgents = 0
   for index, val in enumerate([options.keys0, options.keys1, options.keys2, options.keys3]):
-    if not val: continue
+    if not val or options.parallel > 0: continue
     if numKeyboardAgents == 0:
       agent = keyboardAgents.KeyboardAgent(index)
     elif numKeyboardAgents == 1:
@@ -883,14 +1210,21 @@ def readCommand( argv ):
     numKeyboardAgents += 1
     args['agents'][index] = agent
 
+  # Every game gets its own seed, recorded with its result
+  if options.seed is not None: args['seed'] = options.seed
+  else: args['seed'] = random.randint(0, 2**31 - 1)
+
   # Choose a layout
   import layout
   layouts = []
+  layoutNames = []
   for i in range(options.numGames):
-    if options.layout == 'RANDOM':
-      l = layout.Layout(randomLayout().split('\n'))
-    elif options.layout.startswith('RANDOM'):
-      l = layout.Layout(randomLayout(int(options.layout[6:])).split('\n'))
+    name = options.layout
+    if name == 'RANDOM':
+      # name the maze by its seed so that the game can be played again
+      name = 'RANDOM%d' % random.randint(1, 99999999)
+    if name.startswith('RANDOM'):
+      l = layout.Layout(randomLayout(int(name[6:])).split('\n'))
     elif options.layout.lower().find('capture') == -1:
       raise Exception( 'You must use a capture layout with capture.py')
     else:
@@ -898,13 +1232,21 @@ def readCommand( argv ):
     if l == None: raise Exception("The layout " + options.layout + " cannot be found")
 
     layouts.append(l)
+    layoutNames.append(name)
 
   args['layouts'] = layouts
+  args['layoutNames'] = layoutNames
   args['length'] = options.time
   args['numGames'] = options.numGames
   args['numTraining'] = options.numTraining
   args['record'] = options.record
   args['catchExceptions'] = options.catchExceptions
+  if options.results:
+    args['results'] = ResultsFile(options.results, red=options.red, blue=options.blue,
+                                  redName=options.red_name, blueName=options.blue_name)
+  if options.metrics:
+    args['metrics'] = options.metrics
+    args['metricsFormat'] = options.metricsFormat
   return args
 
 def randomLayout(seed = None):
@@ -950,15 +1292,27 @@ def loadAgents(isRed, factory, textgraphics, cmdLineArgs):
   indices = [2*i + indexAddend for i in range(2)]
   return createTeamFunc(indices[0], indices[1], isRed, **args)
 
-def replayGame( layout, agents, actions, display, length, redTeamName, blueTeamName ):
+def replayGame( layout, agents, actions, display, length, redTeamName, blueTeamName, start=0, startState=None ):
+    """
+    Shows a recorded game from move start onwards.  startState is the state
+    after start moves if the replay could rebuild it; otherwise the first
+    start moves are played without the display.
+    """
     rules = CaptureRules()
     game = rules.newGame( layout, agents, display, length, False, False )
     state = game.state
+    start = min(start, len(actions))
+    if startState is not None:
+      state = startState
+    else:
+      for action in actions[:start]:
+        state = state.generateSuccessor( *action )
+    game.state = state
     display.redTeam = redTeamName
     display.blueTeam = blueTeamName
     display.initialize(state.data)
 
-    for action in actions:
+    for action in actions[start:]:
       # Execute the action
       state = state.generateSuccessor( *action )
       # Change the display
@@ -968,7 +1322,22 @@ def replayGame( layout, agents, actions, display, length, redTeamName, blueTeamN
 
     display.finish()
 
-def runGames( layouts, agents, display, length, numGames, record, numTraining, redTeamName, blueTeamName, muteAgents=False, catchExceptions=False ):
+def runGames( layouts, agents, display, length, numGames, record, numTraining, redTeamName, blueTeamName, muteAgents=False, catchExceptions=False, parallel=0, teams=None, seed=None, results=None, metrics=None, metricsFormat='json', layoutNames=None ):
+  """
+  Plays the games and prints a summary of their scores.  When seed is
+  given, game i is played with the random seed seed + i.  With parallel > 0
+  the games are spread over that many worker processes (see
+  runParallelGames), which load the agents named by teams themselves.
+  Each finished game is also written to results (a ResultsFile) when one
+  is given, with its seed and the name of its layout from layoutNames, and
+  the latency histograms of all games to the file metrics at the end.
+  """
+  if layoutNames is None: layoutNames = [None] * numGames
+  if parallel > 0:
+    games = runParallelGames( layouts, teams, length, numGames, record, redTeamName, blueTeamName, muteAgents, catchExceptions, parallel, seed, results, layoutNames )
+    if numGames > 1: printSummary(games)
+    if metrics: writeMetrics(games, metrics, metricsFormat)
+    return games
 
   rules = CaptureRules()
   games = []
@@ -987,33 +1356,171 @@ def runGames( layouts, agents, display, length, numGames, record, numTraining, r
     else:
         gameDisplay = display
         rules.quiet = False
+    gameSeed = None
+    if seed is not None:
+      gameSeed = seed + i
+      random.seed(gameSeed)
     g = rules.newGame( layout, agents, gameDisplay, length, muteAgents, catchExceptions )
     g.run()
-    if not beQuiet: games.append(g)
+    if not beQuiet:
+      games.append(g)
+      if results: results.write(gameResult(g, i, gameSeed, layoutNames[i]))
 
     g.record = None
     if record:
-      import time, pickle, game
-      #fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
-      #f = file(fname, 'w')
-      components = {'layout': layout, 'agents': [game.Agent() for a in agents], 'actions': g.moveHistory, 'length': length, 'redTeamName': redTeamName, 'blueTeamName':blueTeamName }
-      #f.close()
-      print("recorded")
-      g.record = pickle.dumps(components)
-      with open('replay-%d'%i,'wb') as f:
-        f.write(g.record)
-
-  if numGames > 1:
-    scores = [game.state.data.score for game in games]
-    redWinRate = [s > 0 for s in scores].count(True)/ float(len(scores))
-    blueWinRate = [s < 0 for s in scores].count(True)/ float(len(scores))
-    print('Average Score:', sum(scores) / float(len(scores)))
-    print('Scores:       ', ', '.join([str(score) for score in scores]))
-    print('Red Win Rate:  %d/%d (%.2f)' % ([s > 0 for s in scores].count(True), len(scores), redWinRate))
-    print('Blue Win Rate: %d/%d (%.2f)' % ([s < 0 for s in scores].count(True), len(scores), blueWinRate))
-    print('Record:       ', ', '.join([('Blue', 'Tie', 'Red')[max(0, min(2, 1 + s))] for s in scores]))
+      g.record = recordGame( g, layout, length, redTeamName, blueTeamName )
+      saveRecord( g.record, i )
+
+  if numGames > 1: printSummary(games)
+  if metrics: writeMetrics(games, metrics, metricsFormat)
   return games
 
+def recordGame( g, layout, length, redTeamName, blueTeamName ):
+  "Returns the replay of a finished game in the compact format of captureReplay"
+  import captureReplay
+  return captureReplay.encodeReplay( layout, g.moveHistory, length, redTeamName, blueTeamName,
+                                     g.state.data.score, len(g.agents) )
+
+def saveRecord( record, i ):
+  print("recorded")
+  with open('replay-%d'%i,'wb') as f:
+    f.write(record)
+
+def playParallelGame( job ):
+  """
+  Plays one game of a parallel run in a worker process.  The teams are
+  loaded afresh and the random module is seeded for this game alone, so
+  the result does not depend on which worker plays it.  Returns the
+  finished Game, with its agents replaced by placeholders so that it can
+  be sent back to the parent process, and with what the game printed in
+  g.output for the parent to print in game order.
+  """
+  import textDisplay, game, io, contextlib
+  i, layout, teams, length, record, redTeamName, blueTeamName, muteAgents, catchExceptions, seed = job
+  random.seed(seed)
+  red, redArgs, blue, blueArgs = teams
+  # the parent already reported which teams are playing
+  with contextlib.redirect_stdout(io.StringIO()):
+    redAgents = loadAgents(True, red, True, redArgs)
+    blueAgents = loadAgents(False, blue, True, blueArgs)
+  agents = sum([list(el) for el in zip(redAgents, blueAgents)],[])
+
+  rules = CaptureRules()
+  output = io.StringIO()
+  with contextlib.redirect_stdout(output):
+    g = rules.newGame( layout, agents, textDisplay.NullGraphics(), length, muteAgents, catchExceptions )
+    g.run()
+  g.output = output.getvalue()
+  g.agents = [game.Agent(index) for index in range(len(agents))]
+  g.record = None
+  if record:
+    g.record = recordGame( g, layout, length, redTeamName, blueTeamName )
+  return g
+
+def runParallelGames( layouts, teams, length, numGames, record, redTeamName, blueTeamName, muteAgents, catchExceptions, parallel, seed, results=None, layoutNames=None ):
+  """
+  Plays the games in a pool of parallel worker processes and returns them
+  in order, printing each game's messages as it is collected, so that
+  they do not interleave.  Game i is played with the random seed seed + i.
+  """
+  import multiprocessing
+  jobs = [(i, layouts[i], teams, length, record, redTeamName, blueTeamName, muteAgents, catchExceptions, seed + i)
+          for i in range(numGames)]
+  games = []
+  pool = multiprocessing.Pool(min(parallel, numGames))
+  try:
+    for i, g in enumerate(pool.imap(playParallelGame, jobs)):
+      sys.stdout.write(g.output)
+      if record: saveRecord( g.record, i )
+      if results: results.write(gameResult(g, i, seed + i, layoutNames[i] if layoutNames else None))
+      games.append(g)
+  finally:
+    pool.terminate()
+  return games
+
+def gameResult( g, i, seed=None, layout=None ):
+  """
+  The outcome of finished game number i as a JSON-ready dict.  The layout
+  is the name it was played on, with random mazes named RANDOM<seed>, so
+  that with the seed the game can be played again.  Agent times and
+  warnings are only measured when exceptions are caught (-c).
+  """
+  numAgents = len(g.agents)
+  return {'game': i, 'layout': layout, 'seed': seed, 'score': g.state.data.score, 'moves': len(g.moveHistory),
+          'agentTimes': [round(t, 6) for t in g.totalAgentTimes],
+          'timeWarnings': list(g.totalAgentTimeWarnings),
+          'crashed': [g.crashedAgent == index for index in range(numAgents)],
+          'timedOut': g.agentTimeout}
+
+class ResultsFile:
+  """
+  An append-only file of game results, one JSON object per line, for
+  dashboards that follow it and for long runs that may be interrupted.
+
+  Every line is flushed as soon as it is written, so readers see each game
+  when it ends; it is synced to disk after every syncEvery lines or
+  syncInterval seconds, and on close, so a crash loses nothing that was
+  flushed and a power failure at most the last batch.  The keyword
+  arguments (layout, teams, ...) are added to every line.
+  """
+  def __init__( self, path, syncEvery=16, syncInterval=2.0, **context ):
+    self.file = open(path, 'a')
+    self.syncEvery = syncEvery
+    self.syncInterval = syncInterval
+    self.context = context
+    self.unsynced = 0
+    self.lastSync = time.time()
+
+  def write( self, result ):
+    import json
+    line = dict(self.context)
+    line.update(result)
+    self.file.write(json.dumps(line) + '\n')
+    self.file.flush()
+    self.unsynced += 1
+    if self.unsynced >= self.syncEvery or time.time() - self.lastSync >= self.syncInterval:
+      self.sync()
+
+  def sync( self ):
+    import os
+    os.fsync(self.file.fileno())
+    self.unsynced = 0
+    self.lastSync = time.time()
+
+  def close( self ):
+    if self.file.closed: return
+    self.sync()
+    self.file.close()
+
+def printSummary( games ):
+  "Prints the average score, win rates and record of a list of finished games"
+  scores = [game.state.data.score for game in games]
+  redWinRate = [s > 0 for s in scores].count(True)/ float(len(scores))
+  blueWinRate = [s < 0 for s in scores].count(True)/ float(len(scores))
+  print('Average Score:', sum(scores) / float(len(scores)))
+  print('Scores:       ', ', '.join([str(score) for score in scores]))
+  print('Red Win Rate:  %d/%d (%.2f)' % ([s > 0 for s in scores].count(True), len(scores), redWinRate))
+  print('Blue Win Rate: %d/%d (%.2f)' % ([s < 0 for s in scores].count(True), len(scores), blueWinRate))
+  print('Record:       ', ', '.join([('Blue', 'Tie', 'Red')[max(0, min(2, 1 + s))] for s in scores]))
+
+def writeMetrics( games, path, format='json' ):
+  """
+  Writes the latency histograms of the games, merged, to path: as JSON
+  (one entry per step and agent, with quantiles and bucket counts) or in
+  the Prometheus text exposition format.
+  """
+  import json
+  from game import GameMetrics
+  metrics = GameMetrics()
+  for g in games:
+    metrics.merge(g.metrics)
+  with open(path, 'w') as f:
+    if format == 'prometheus':
+      f.write(metrics.prometheusText())
+    else:
+      json.dump({'games': len(games), 'histograms': metrics.asList()}, f, indent=1)
+      f.write('\n')
+
 def save_score(game):
     with open('score', 'w') as f:
         print(game.state.data.score, file=f)
@@ -1030,7 +1537,10 @@ if __name__ == '__main__':
   > python capture.py --help
   """
   options = readCommand( sys.argv[1:] ) # Get game components based on input
-  games = runGames(**options)
+  try:
+    games = runGames(**options)
+  finally:
+    if options.get('results'): options['results'].close()
 
   save_score(games[0])
   # import cProfile
@@ -17,10 +17,17 @@
 """
 
 from game import Agent
+from game import BitGrid
 import distanceCalculator
+import collections
 from util import nearestPoint
 import util, capture
 
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
 # Note: the following class is not used, but is kept for backwards
 # compatibility with team submissions that try to import it.
 class AgentFactory:
@@ -44,6 +51,146 @@ class RandomAgent( Agent ):
     import random
     return random.choice( state.getLegalActions( self.index ) )
 
+class ObservationHistory:
+  """
+  The observations of an agent, oldest first, with the list operations
+  agents use on them (append, len, indexing, iteration).
+
+  Only the last keepStates observations are kept as GameStates.  Every
+  observation is also kept as a compact snapshot: the agent states, score,
+  capsules and the food grid as the XOR of its bits with those of the
+  observation before it (usually 0, as food changes on few moves).  Reading
+  an older observation rebuilds a read-only GameState equal to it from its
+  snapshot.  With keepStates None every GameState is kept, as in a list.
+
+  With maxLength set only the last maxLength observations are kept at all.
+  """
+  def __init__(self, maxLength = None, keepStates = 2):
+    self.maxLength = maxLength
+    self.keepStates = keepStates
+    self.clear()
+
+  def clear(self):
+    if self.keepStates is None:
+      self.states = collections.deque(maxlen = self.maxLength)
+    else:
+      self.states = collections.deque(maxlen = self.keepStates if self.maxLength is None else min(self.keepStates, self.maxLength))
+    self.snapshots = collections.deque(maxlen = self.maxLength)
+    self.lastFood = 0
+    self.template = None
+
+  def append(self, gameState):
+    self.states.append(gameState)
+    if self.keepStates is None: return
+    if self.template is None: self.template = gameState
+    data = gameState.data
+    food = data.food.bits
+    self.snapshots.append((food ^ self.lastFood, tuple(data.capsules),
+                           tuple((s.configuration, s.isPacman, s.scaredTimer, s.numCarrying, s.numReturned)
+                                 for s in data.agentStates),
+                           data.score, data.timeleft, data._agentMoved, data._foodEaten, data._foodAdded, data._capsuleEaten))
+    self.lastFood = food
+
+  def __len__(self):
+    return len(self.states) if self.keepStates is None else len(self.snapshots)
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return list(self)[i]
+    n = len(self)
+    if i < 0: i += n
+    if i < 0 or i >= n: raise IndexError('observation history index out of range')
+    stored = i - (n - len(self.states))
+    if stored >= 0: return self.states[stored]
+    # Undo the food changes from the newest observation back to this one
+    food = self.lastFood
+    for j in range(n - 1, i, -1):
+      food ^= self.snapshots[j][0]
+    return self.rebuild(self.snapshots[i], food)
+
+  def __iter__(self):
+    if self.keepStates is None:
+      return iter(list(self.states))
+    n = len(self)
+    foods = []
+    food = self.lastFood
+    for j in range(n - 1, -1, -1):
+      foods.append(food)
+      food ^= self.snapshots[j][0]
+    foods.reverse()
+    rebuilt = [self.rebuild(self.snapshots[j], foods[j]) for j in range(n - len(self.states))]
+    return iter(rebuilt + list(self.states))
+
+  def rebuild(self, snapshot, food):
+    "Returns a read-only GameState for a snapshot whose food bits are food"
+    state = capture.GameState(self.template)
+    data = state.data
+    (delta, capsules, agents, data.score, data.timeleft,
+     data._agentMoved, data._foodEaten, data._foodAdded, data._capsuleEaten) = snapshot
+    data.food = BitGrid(data.food.width, data.food.height, bits = food)
+    data.capsules = list(capsules)
+    for agentState, (configuration, isPacman, scaredTimer, numCarrying, numReturned) in zip(data.agentStates, agents):
+      agentState.configuration = configuration
+      agentState.isPacman = isPacman
+      agentState.scaredTimer = scaredTimer
+      agentState.numCarrying = numCarrying
+      agentState.numReturned = numReturned
+    state.zobrist = None
+    state.foodDistances = None
+    state.readOnly = True
+    return state
+
+def scoreFeatures(featureRows, weights):
+  """
+  Returns the linear scores (features * weights) of a batch of feature
+  Counters as a list of floats.  weights is one dict for every row, or a
+  list of dicts, one per row.  The rows are stacked into a matrix and scored
+  with one matrix-vector product (or a row-wise product for per-row
+  weights); a feature missing from a row or from the weights counts as 0.
+  Without numpy each row is scored on its own.
+  """
+  if len(featureRows) == 0: return []
+  shared = isinstance(weights, dict)
+  if not shared and all(w is weights[0] or w == weights[0] for w in weights):
+    weights, shared = weights[0], True
+  if numpy is None:
+    if shared: return [float(row * weights) for row in featureRows]
+    return [float(row * w) for row, w in zip(featureRows, weights)]
+
+  columns = {}
+  for row in featureRows:
+    for name in row:
+      if name not in columns: columns[name] = len(columns)
+  get = dict.get
+  matrix = numpy.array([[get(row, name, 0) for name in columns] for row in featureRows], dtype = float)
+  if shared:
+    vector = numpy.array([get(weights, name, 0) for name in columns], dtype = float)
+    return matrix.dot(vector).tolist()
+  weightMatrix = numpy.array([[get(w, name, 0) for name in columns] for w in weights], dtype = float)
+  return (matrix * weightMatrix).sum(axis = 1).tolist()
+
+class BatchEvaluationMixin:
+  """
+  Mix into a reflex agent whose chooseAction scores actions with
+  evaluateActions (such as the ReflexCaptureAgents of baselineTeam and
+  myTeam) to score all of its candidate actions in one batch:
+
+    class MyAgent(BatchEvaluationMixin, ReflexCaptureAgent):
+      def getFeatures(self, gameState, action): ...
+      def getWeights(self, gameState, action): ...
+
+  The agent's own getFeatures and getWeights are used unchanged; only the
+  dot products move into one matrix product (see scoreFeatures).  Search
+  code can score a batch of leaves the same way with evaluateFeatures.
+  """
+  def evaluateActions(self, gameState, actions):
+    features = [self.getFeatures(gameState, action) for action in actions]
+    weights = [self.getWeights(gameState, action) for action in actions]
+    return scoreFeatures(features, weights)
+
+  def evaluateFeatures(self, featureRows, weights):
+    return scoreFeatures(featureRows, weights)
+
 class CaptureAgent(Agent):
   """
   A base class for capture agents.  The convenience methods herein handle
@@ -51,6 +198,11 @@ class CaptureAgent(Agent):
 
   Recommended Usage:  Subclass CaptureAgent and override chooseAction.
   """
+  # Bounds on the observation history (see ObservationHistory): the number
+  # of observations kept (None for the whole game) and how many of the
+  # latest are kept as GameStates rather than compact snapshots
+  historyLength = None
+  historyStates = 2
 
   #############################
   # Methods to store key info #
@@ -63,8 +215,9 @@ class CaptureAgent(Agent):
     self.red = true if you're on the red team, false otherwise
     self.agentsOnTeam = a list of agent objects that make up your team
     self.distancer = distance calculator (contest code provides this)
-    self.observationHistory = list of GameState objects that correspond
-        to the sequential order of states that have occurred so far this game
+    self.observationHistory = the GameState objects that correspond to the
+        sequential order of states that have occurred so far this game
+        (an ObservationHistory; see historyLength and historyStates)
     self.timeForComputing = an amount of time to give each turn for computing maze distances
         (part of the provided distance calculator)
     """
@@ -81,7 +234,7 @@ class CaptureAgent(Agent):
     self.distancer = None
 
     # A history of observations
-    self.observationHistory = []
+    self.observationHistory = ObservationHistory(self.historyLength, self.historyStates)
 
     # Time to spend each turn on computing maze distances
     self.timeForComputing = timeForComputing
@@ -110,7 +263,7 @@ class CaptureAgent(Agent):
       self.display = __main__._display
 
   def final(self, gameState: capture.GameState):
-    self.observationHistory = []
+    self.observationHistory.clear()
 
   def registerTeam(self, agentsOnTeam):
     """
@@ -194,6 +347,17 @@ class CaptureAgent(Agent):
     else:
       return gameState.getBlueFood()
 
+  def getFoodDistances(self, gameState: capture.GameState):
+    """
+    Returns the maze distance field to the food you're meant to eat: m[p] is
+    the distance from position p to the nearest such food.  The field is
+    kept up to date by successor states, so this is cheap to call often.
+    """
+    if self.red:
+      return gameState.getBlueFoodDistances()
+    else:
+      return gameState.getRedFoodDistances()
+
   def getCapsules(self, gameState: capture.GameState):
     if self.red:
       return gameState.getBlueCapsules()
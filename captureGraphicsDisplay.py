@@ -192,6 +192,7 @@ class PacmanGraphics:
     self.distributionImages = None  # Initialized lazily
     self.drawStaticObjects(state)
     self.drawAgentObjects(state)
+    self.infoPane.updateScore(state.score, state.timeleft)
 
     # Information
     self.previousState = state
@@ -221,10 +222,12 @@ class PacmanGraphics:
     self.distributionImages = dist
 
   def drawStaticObjects(self, state):
+    # food and capsules are drawn from the state, not the layout, since a
+    # replay can start part way through a game (capture.py --seek)
     layout = self.layout
     self.drawWalls(layout.walls)
-    self.food = self.drawFood(layout.food)
-    self.capsules = self.drawCapsules(layout.capsules)
+    self.food = self.drawFood(state.food)
+    self.capsules = self.drawCapsules(state.capsules)
     refresh()
 
   def drawAgentObjects(self, state):
@@ -688,6 +691,7 @@ class FirstPersonPacmanGraphics(PacmanGraphics):
     self.distributionImages = None  # initialize lazily
     self.drawStaticObjects(state)
     self.drawAgentObjects(state)
+    self.infoPane.updateScore(state.score, state.timeleft)
 
     # Information
     self.previousState = state
@@ -0,0 +1,349 @@
+# captureReplay.py
+# ----------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+A compact replay format for capture games.
+
+A replay file holds a short fixed header followed by a zlib-compressed body:
+
+  header:    magic 'CRPL', format version, number of agents, game length,
+             number of moves, keyframe interval, final score
+  body:      the layout text and its SHA-1, the team names,
+             the moves, 5 bits each (2 bits agent, 3 bits action),
+             a keyframe of the game state every keyframeInterval moves
+
+Keyframes let Replay.stateAt(move) rebuild the state after any move by
+playing at most keyframeInterval moves from the keyframe before it,
+instead of the whole game from the start.
+
+  > data = encodeReplay(layout, game.moveHistory, length, 'Red', 'Blue', score)
+  > replay = decodeReplay(data)
+  > state = replay.stateAt(600)
+
+Run as a script, it checks many replays without a display, in a pool of
+processes, and writes statistics about each game to a CSV file:
+
+  > python captureReplay.py -o games.csv replay-*
+"""
+
+import sys, os, struct, zlib, hashlib
+from game import Directions, Actions, Configuration, BitGrid
+import layout as layoutModule
+
+REPLAY_MAGIC = b'CRPL'
+REPLAY_VERSION = 1
+REPLAY_HEADER = struct.Struct('<4sHHIIIi')
+
+# Action codes; the agent index takes the two bits above them
+ACTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+ACTION_CODES = dict((action, code) for code, action in enumerate(ACTIONS))
+MOVE_BITS = 5
+
+# Keyframe layout: score and time left, then per agent position, direction,
+# mode, scared timer, carried and returned food, then capsules and food bits
+FRAME_HEADER = struct.Struct('<iiH')
+FRAME_AGENT = struct.Struct('<HHBBHHH')
+FRAME_CAPSULE = struct.Struct('<HH')
+
+DEFAULT_KEYFRAME_INTERVAL = 100
+
+def isReplay(data):
+  "True if the bytes start like a replay in this format"
+  return data[:len(REPLAY_MAGIC)] == REPLAY_MAGIC
+
+def layoutHash(layoutText):
+  return hashlib.sha1('\n'.join(layoutText).encode('utf-8')).digest()
+
+##########
+# Writer #
+##########
+
+def packMoves(moves):
+  bits = 0
+  for i, (agentIndex, action) in enumerate(moves):
+    bits |= (agentIndex << 3 | ACTION_CODES[action]) << (MOVE_BITS * i)
+  return bits.to_bytes((MOVE_BITS * len(moves) + 7) // 8, 'little')
+
+def packKeyframe(state):
+  data = state.data
+  parts = [FRAME_HEADER.pack(data.score, data.timeleft, len(data.capsules))]
+  for agentState in data.agentStates:
+    x, y = agentState.configuration.getPosition()
+    parts.append(FRAME_AGENT.pack(int(x), int(y), ACTION_CODES[agentState.configuration.direction],
+                                  agentState.isPacman, agentState.scaredTimer,
+                                  agentState.numCarrying, agentState.numReturned))
+  for x, y in data.capsules:
+    parts.append(FRAME_CAPSULE.pack(x, y))
+  food = data.food
+  parts.append(food.bits.to_bytes((food.width * food.height + 7) // 8, 'little'))
+  return b''.join(parts)
+
+def packString(text):
+  encoded = text.encode('utf-8')
+  return struct.pack('<I', len(encoded)) + encoded
+
+def encodeReplay(layout, moves, length, redTeamName, blueTeamName, score,
+                 numAgents = 4, keyframeInterval = DEFAULT_KEYFRAME_INTERVAL):
+  """
+  Returns a finished game as replay bytes.  The moves are played again from
+  the start of the game to take the keyframes.
+  """
+  state = initialState(layout, numAgents, length)
+  frames = [packKeyframe(state)]
+  for i, (agentIndex, action) in enumerate(moves):
+    state = state.generateSuccessor(agentIndex, action)
+    if (i + 1) % keyframeInterval == 0:
+      frames.append(packKeyframe(state))
+
+  body = [packString('\n'.join(layout.layoutText)), layoutHash(layout.layoutText),
+          packString(redTeamName), packString(blueTeamName), packMoves(moves)]
+  for frame in frames:
+    body.append(struct.pack('<I', len(frame)) + frame)
+  header = REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, numAgents, length, len(moves), keyframeInterval, score)
+  return header + zlib.compress(b''.join(body))
+
+##########
+# Reader #
+##########
+
+class Replay:
+  """
+  A decoded replay: the layout, team names, game length, final score and
+  the (agentIndex, action) moves of the game.  The score is None for games
+  recorded in the old pickled format, which did not keep it.
+  """
+  def __init__(self, layout, moves, keyframes, keyframeInterval, numAgents, length,
+               redTeamName, blueTeamName, score):
+    self.layout = layout
+    self.moves = moves
+    self.keyframes = keyframes
+    self.keyframeInterval = keyframeInterval
+    self.numAgents = numAgents
+    self.length = length
+    self.redTeamName = redTeamName
+    self.blueTeamName = blueTeamName
+    self.score = score
+
+  def stateAt(self, move):
+    """
+    Returns the game state after the first move moves, rebuilt from the
+    closest keyframe at or before it.
+    """
+    if move < 0 or move > len(self.moves):
+      raise IndexError('move %d is outside the %d moves of the game' % (move, len(self.moves)))
+    frame = min(move // self.keyframeInterval, len(self.keyframes) - 1)
+    state = unpackKeyframe(self.keyframes[frame], self.layout, self.numAgents, self.length)
+    for agentIndex, action in self.moves[frame * self.keyframeInterval:move]:
+      state = state.generateSuccessor(agentIndex, action)
+    return state
+
+def unpackMoves(data, numMoves):
+  bits = int.from_bytes(data, 'little')
+  mask = (1 << MOVE_BITS) - 1
+  moves = []
+  for i in range(numMoves):
+    code = (bits >> (MOVE_BITS * i)) & mask
+    moves.append((code >> 3, ACTIONS[code & 7]))
+  return moves
+
+def unpackKeyframe(frame, layout, numAgents, length):
+  state = initialState(layout, numAgents, length)
+  data = state.data
+  data.score, data.timeleft, numCapsules = FRAME_HEADER.unpack_from(frame)
+  offset = FRAME_HEADER.size
+  for agentState in data.agentStates:
+    x, y, direction, isPacman, scaredTimer, numCarrying, numReturned = FRAME_AGENT.unpack_from(frame, offset)
+    offset += FRAME_AGENT.size
+    agentState.configuration = Configuration((x, y), ACTIONS[direction])
+    agentState.isPacman = bool(isPacman)
+    agentState.scaredTimer = scaredTimer
+    agentState.numCarrying = numCarrying
+    agentState.numReturned = numReturned
+  capsules = []
+  for i in range(numCapsules):
+    capsules.append(FRAME_CAPSULE.unpack_from(frame, offset))
+    offset += FRAME_CAPSULE.size
+  data.capsules = capsules
+  data.food = BitGrid(layout.width, layout.height, bits = int.from_bytes(frame[offset:], 'little'))
+  return state
+
+def decodeReplay(data):
+  "Returns the Replay held in replay bytes"
+  magic, version, numAgents, length, numMoves, keyframeInterval, score = REPLAY_HEADER.unpack_from(data)
+  if magic != REPLAY_MAGIC:
+    raise ValueError('not a capture replay')
+  if version != REPLAY_VERSION:
+    raise ValueError('unsupported replay version %d' % version)
+  body = zlib.decompress(data[REPLAY_HEADER.size:])
+
+  offset = [0]
+  def take(size):
+    chunk = body[offset[0]:offset[0] + size]
+    offset[0] += size
+    return chunk
+  def takeString():
+    size, = struct.unpack('<I', take(4))
+    return take(size).decode('utf-8')
+
+  layoutText = takeString().split('\n')
+  if layoutHash(layoutText) != take(20):
+    raise ValueError('the layout of the replay is corrupt')
+  redTeamName = takeString()
+  blueTeamName = takeString()
+  moves = unpackMoves(take((MOVE_BITS * numMoves + 7) // 8), numMoves)
+  keyframes = []
+  while offset[0] < len(body):
+    size, = struct.unpack('<I', take(4))
+    keyframes.append(take(size))
+  return Replay(layoutModule.Layout(layoutText), moves, keyframes, keyframeInterval, numAgents, length,
+                redTeamName, blueTeamName, score)
+
+def loadReplay(path):
+  "Returns the Replay in a file of either this format or the old pickled one"
+  with open(path, 'rb') as f:
+    data = f.read()
+  if isReplay(data):
+    return decodeReplay(data)
+  import pickle
+  recorded = pickle.loads(data)
+  numAgents = len(recorded['agents'])
+  # the pickled layout is of the code that recorded it (old ones keep food
+  # in a list-backed Grid), so it is made again from its text
+  layout = layoutModule.Layout(recorded['layout'].layoutText)
+  # a single keyframe: seeking plays the game from the start
+  frame = packKeyframe(initialState(layout, numAgents, recorded['length']))
+  return Replay(layout, list(recorded['actions']), [frame], len(recorded['actions']) + 1,
+                numAgents, recorded['length'], recorded['redTeamName'], recorded['blueTeamName'], None)
+
+def initialState(layout, numAgents, length):
+  import capture
+  state = capture.GameState()
+  state.initialize(layout, numAgents)
+  state.data.timeleft = length
+  return state
+
+############
+# Analysis #
+############
+
+def analyzeReplay(path):
+  """
+  Plays a replay again without a display and returns a dict of statistics
+  about the game: the final score and whether it matches the recorded one,
+  and per agent the food eaten, the deaths, the capsules eaten (as
+  'move:x,y' entries) and the number of its moves made as a Pacman.
+  """
+  replay = loadReplay(path)
+  numAgents = replay.numAgents
+  foodEaten = [0] * numAgents
+  deaths = [0] * numAgents
+  pacmanMoves = [0] * numAgents
+  capsules = [[] for i in range(numAgents)]
+
+  state = replay.stateAt(0)
+  for move, (agentIndex, action) in enumerate(replay.moves):
+    x, y = state.data.agentStates[agentIndex].getPosition()
+    dx, dy = Actions.directionToVector(action)
+    # agents only die when the one moving lands on an opponent
+    if any(state.data.agentStates[i].getPosition() == (x + dx, y + dy)
+           for i in range(numAgents) if state.isOnRedTeam(i) != state.isOnRedTeam(agentIndex)):
+      for i in sentHome(state, agentIndex, action): deaths[i] += 1
+    state = state.generateSuccessor(agentIndex, action)
+    data = state.data
+    if data._foodEaten is not None: foodEaten[agentIndex] += 1
+    if data._capsuleEaten is not None:
+      capsules[agentIndex].append('%d:%d,%d' % ((move,) + tuple(data._capsuleEaten)))
+    if data.agentStates[agentIndex].isPacman: pacmanMoves[agentIndex] += 1
+
+  stats = {'file': path, 'red': replay.redTeamName, 'blue': replay.blueTeamName,
+           'moves': len(replay.moves), 'score': state.data.score, 'recordedScore': replay.score,
+           'scoreMatches': replay.score is None or replay.score == state.data.score}
+  for i in range(numAgents):
+    stats['foodEaten%d' % i] = foodEaten[i]
+    stats['deaths%d' % i] = deaths[i]
+    stats['pacmanMoves%d' % i] = pacmanMoves[i]
+    stats['capsules%d' % i] = ' '.join(capsules[i])
+  return stats
+
+def sentHome(state, agentIndex, action):
+  """
+  The agents that capture.AgentRules.checkDeath sends home when the agent
+  plays action in state.  The rules are run on a copy whose agents have
+  new start configurations, so an agent sent home shows even if it was
+  already on its start cell.
+  """
+  import capture
+  probe = capture.GameState(state)
+  capture.AgentRules.applyAction(probe, action, agentIndex)
+  for agentState in probe.data.agentStates:
+    agentState.start = Configuration(agentState.start.pos, agentState.start.direction)
+  capture.AgentRules.checkDeath(probe, agentIndex)
+  return [i for i, agentState in enumerate(probe.data.agentStates) if agentState.configuration is agentState.start]
+
+def analyzeReplayFile(path):
+  "analyzeReplay for a worker process: an unreadable file gives an error row"
+  try:
+    return analyzeReplay(path)
+  except Exception as e:
+    return {'file': path, 'error': '%s: %s' % (type(e).__name__, e), 'scoreMatches': False}
+
+def analyzeReplays(paths, output, parallel = 1):
+  """
+  Analyzes the replays over a pool of processes and writes one CSV row per
+  replay to output, in the order of paths.  Returns the rows.
+  """
+  import csv, multiprocessing
+  parallel = max(1, parallel)
+  pool = multiprocessing.Pool(max(1, min(parallel, len(paths))))
+  try:
+    rows = list(pool.imap(analyzeReplayFile, paths, chunksize = max(1, len(paths) // (8 * parallel))))
+  finally:
+    pool.terminate()
+  columns = []
+  for row in sorted(rows, key = lambda row: 'error' in row):
+    columns.extend(column for column in row if column not in columns)
+  with open(output, 'w', newline = '') as f:
+    writer = csv.DictWriter(f, columns)
+    writer.writeheader()
+    writer.writerows(rows)
+  return rows
+
+def readCommand(argv):
+  from optparse import OptionParser
+  usageStr = """
+  USAGE:      python captureReplay.py <options> <replay> ...
+  EXAMPLES:   python captureReplay.py -o games.csv replay-*
+                  - plays every replay again without a display, checks its final
+                    score and writes statistics about each game to games.csv
+  """
+  parser = OptionParser(usageStr)
+  parser.add_option('-o', '--output', default='replays.csv',
+                    help='CSV file the statistics are written to (default: %default)')
+  parser.add_option('--parallel', type='int', default=os.cpu_count() or 1, metavar='N',
+                    help='Number of replays analyzed at once (default: %default)')
+  options, paths = parser.parse_args(argv)
+  if len(paths) == 0:
+    parser.error('No replay files given')
+  if options.parallel < 1:
+    parser.error('--parallel must be at least 1')
+  return options, paths
+
+if __name__ == '__main__':
+  options, paths = readCommand(sys.argv[1:])
+  rows = analyzeReplays(paths, options.output, options.parallel)
+  bad = [row for row in rows if not row['scoreMatches']]
+  for row in bad:
+    print('%s: %s' % (row['file'], row.get('error') or 'final score %s, recorded %s' % (row['score'], row['recordedScore'])))
+  print('%d replays analyzed, %d failed; statistics written to %s' % (len(rows), len(bad), options.output))
+  sys.exit(1 if bad else 0)
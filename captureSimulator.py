@@ -0,0 +1,436 @@
+# captureSimulator.py
+# -------------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+A fast simulator of the capture rules, for rollouts.
+
+A simulator state is a flat list of integers instead of a tree of objects:
+
+  [score, timeleft, win, food bits, capsule bits,
+   then for each agent: cell, direction, isPacman, scaredTimer, numCarrying, numReturned]
+
+Cell (x, y) is x * height + y, the bit order of game.BitGrid, so the food
+and capsules are single integers and a state is copied with state[:].
+Directions are indices into ACTIONS.  Simulator.step plays one move with
+the same rules as capture.AgentRules (moving, eating, carrying and
+returning food, capsules, scared timers, deaths and the food dropped on
+death), including their quirks, so trajectories match GameState's exactly:
+
+  > sim = Simulator(gameState)
+  > state = sim.fromGameState(gameState)
+  > sim.step(state, agentIndex, ACTION_CODES[action])
+  > gameState = sim.toGameState(state)
+
+Run as a script, it plays recorded games, and random games on layouts, on
+both this simulator and capture.GameState, and reports the first move
+where they disagree:
+
+  > python captureSimulator.py replay-*
+  > python captureSimulator.py -l defaultCapture,RANDOM13 -n 20
+"""
+
+import sys, random
+from game import Actions, Configuration, BitGrid
+from captureReplay import ACTIONS, ACTION_CODES
+import capture
+
+# Indices into a simulator state
+SCORE = 0
+TIMELEFT = 1
+WIN = 2
+FOOD = 3
+CAPSULES = 4
+AGENTS = 5
+
+# Indices into an agent's fields, from AGENTS + agentIndex * AGENT_FIELDS
+CELL = 0
+DIRECTION = 1
+PACMAN = 2
+SCARED = 3
+CARRYING = 4
+RETURNED = 5
+AGENT_FIELDS = 6
+
+STOP = ACTION_CODES['Stop']
+FIELD_NAMES = ['score', 'timeleft', 'win', 'food', 'capsules']
+AGENT_FIELD_NAMES = ['position', 'direction', 'isPacman', 'scaredTimer', 'numCarrying', 'numReturned']
+
+# Neighbours in the order AgentRules.dumpFoodFromDeath searches them
+DUMP_NEIGHBOURS = [(dx, dy) for dx in [-1, 0, 1] for dy in [-1, 0, 1]]
+
+class Simulator:
+  """
+  The tables of one game: the maze, where agents start and which team they
+  are on.  Its methods read and change simulator states in place.
+  """
+  def __init__(self, gameState):
+    layout = gameState.data.layout
+    self.layout = layout
+    self.width = width = layout.width
+    self.height = height = layout.height
+    self.numAgents = numAgents = gameState.getNumAgents()
+    self.template = gameState.deepCopy()
+
+    self.positions = [(x, y) for x in range(width) for y in range(height)]
+    self.redSide = [x < width / 2 for x, y in self.positions]
+    halfway = width // 2
+    # capsules a team may eat, as capture.halfList splits them: [blue, red]
+    self.capsuleMasks = [sum(1 << self.cell(x, y) for x in range(halfway + 1) for y in range(height)), 0]
+    self.capsuleMasks[1] = ((1 << (width * height)) - 1) ^ self.capsuleMasks[0]
+    self.capsuleOrder = [self.cell(x, y) for x, y in layout.capsules]
+    self.layoutCapsules = sum(1 << cell for cell in self.capsuleOrder)
+
+    # targets[cell * 5 + action] is the cell the action leads to, or -1
+    table = layout.getLegalActionTable()
+    self.targets = [-1] * (width * height * len(ACTIONS))
+    self.legal = [()] * (width * height)
+    for (x, y), actions in table.items():
+      cell = self.cell(x, y)
+      codes = tuple(ACTION_CODES[action] for action in actions)
+      self.legal[cell] = codes
+      for code in codes:
+        dx, dy = Actions.directionToVector(ACTIONS[code])
+        self.targets[cell * len(ACTIONS) + code] = self.cell(x + int(dx), y + int(dy))
+
+    self.red = [gameState.isOnRedTeam(i) for i in range(numAgents)]
+    # teams[isRed] is the indices of that team
+    self.teams = [gameState.getBlueTeamIndices(), gameState.getRedTeamIndices()]
+    self.bases = [AGENTS + i * AGENT_FIELDS for i in range(numAgents)]
+    self.starts = []
+    for agentState in gameState.data.agentStates:
+      x, y = agentState.start.getPosition()
+      self.starts.append((self.cell(int(x), int(y)), ACTION_CODES[agentState.start.getDirection()]))
+    self.foodToWin = (layout.totalFood / 2) - capture.MIN_FOOD
+    self.dumpOrders = [None] * (width * height)
+
+  def cell(self, x, y):
+    return x * self.height + y
+
+  #################
+  # Conversions   #
+  #################
+
+  def fromGameState(self, gameState):
+    "Returns the simulator state of a capture.GameState"
+    data = gameState.data
+    food = data.food
+    if isinstance(food, BitGrid): foodBits = food.bits
+    else: foodBits = sum(1 << self.cell(x, y) for x, y in food.asList())
+    capsuleBits = 0
+    for x, y in data.capsules:
+      capsuleBits |= 1 << self.cell(x, y)
+    state = [data.score, data.timeleft, data._win, foodBits, capsuleBits]
+    for agentState in data.agentStates:
+      x, y = agentState.getPosition()
+      state += [self.cell(int(x), int(y)), ACTION_CODES[agentState.getDirection()], agentState.isPacman,
+                agentState.scaredTimer, agentState.numCarrying, agentState.numReturned]
+    return state
+
+  def toGameState(self, state):
+    """
+    Returns a capture.GameState equal to a simulator state.  Capsules are
+    listed in the order of the layout, which is the order the rules keep,
+    and any others after them.
+    """
+    gameState = self.template.deepCopy()
+    data = gameState.data
+    data.score, data.timeleft, data._win = state[SCORE], state[TIMELEFT], state[WIN]
+    data.food = BitGrid(self.width, self.height, bits = state[FOOD])
+    capsules = state[CAPSULES]
+    data.capsules = [self.positions[cell] for cell in self.capsuleOrder if capsules >> cell & 1]
+    others = capsules & ~self.layoutCapsules
+    while others:
+      low = others & -others
+      data.capsules.append(self.positions[low.bit_length() - 1])
+      others ^= low
+    for base, agentState in zip(self.bases, data.agentStates):
+      agentState.configuration = Configuration(self.positions[state[base + CELL]], ACTIONS[state[base + DIRECTION]])
+      agentState.isPacman = bool(state[base + PACMAN])
+      agentState.scaredTimer = state[base + SCARED]
+      agentState.numCarrying = state[base + CARRYING]
+      agentState.numReturned = state[base + RETURNED]
+    gameState.zobrist = None
+    gameState.foodDistances = None
+    return gameState
+
+  #################
+  # Queries       #
+  #################
+
+  def getLegalActions(self, state, agentIndex):
+    "The action codes of an agent, in the order of GameState.getLegalActions"
+    return self.legal[state[self.bases[agentIndex]]]
+
+  def getAgentPosition(self, state, agentIndex):
+    return self.positions[state[self.bases[agentIndex]]]
+
+  def isOver(self, state):
+    "True once a team has won or the game has run out of moves"
+    return state[WIN] or state[TIMELEFT] <= 0
+
+  #################
+  # Rules         #
+  #################
+
+  def step(self, state, agentIndex, action):
+    """
+    Plays action (an index into ACTIONS) for an agent, changing the state
+    to what GameState.generateSuccessor would give.
+    """
+    base = self.bases[agentIndex]
+    target = self.targets[state[base] * 5 + action]
+    if target < 0:
+      raise Exception("Illegal action " + str(ACTIONS[action]))
+    state[WIN] = False
+    scoreChange = 0
+
+    # AgentRules.applyAction
+    state[base] = target
+    if action != STOP: state[base + DIRECTION] = action
+    isRed = self.red[agentIndex]
+    isPacman = self.redSide[target] != isRed
+    state[base + PACMAN] = isPacman
+    eats = isPacman
+    carrying = state[base + CARRYING]
+    if carrying > 0 and not isPacman:
+      scoreChange += carrying if isRed else -carrying
+      state[base + RETURNED] += carrying
+      state[base + CARRYING] = 0
+      returned = [0, 0]
+      for i, b in enumerate(self.bases):
+        returned[self.red[i]] += state[b + RETURNED]
+      if returned[1] >= self.foodToWin or returned[0] >= self.foodToWin:
+        state[WIN] = True
+      # applyAction reuses its agentState variable to count the returned
+      # food, so it then asks whether the last agent is a Pacman
+      eats = state[self.bases[-1] + PACMAN]
+    if eats:
+      self.consume(state, target, isRed)
+
+    scoreChange += self.checkDeath(state, agentIndex)
+
+    # AgentRules.decrementTimer
+    if state[base + SCARED] > 0:
+      state[base + SCARED] -= 1
+
+    state[SCORE] += scoreChange
+    state[TIMELEFT] -= 1
+
+  def consume(self, state, cell, isRed):
+    bit = 1 << cell
+    if state[FOOD] & bit:
+      for i in self.teams[isRed]:
+        b = self.bases[i]
+        if state[b] == cell:
+          state[b + CARRYING] += 1
+          break
+      state[FOOD] ^= bit
+    if state[CAPSULES] & bit & self.capsuleMasks[isRed]:
+      state[CAPSULES] ^= bit
+      for i in self.teams[not isRed]:
+        state[self.bases[i] + SCARED] = capture.SCARED_TIME
+
+  def checkDeath(self, state, agentIndex):
+    "Sends home whoever was eaten by the move, and returns the score change"
+    base = self.bases[agentIndex]
+    isRed = self.red[agentIndex]
+    points = -capture.KILL_POINTS if isRed else capture.KILL_POINTS
+    scoreChange = 0
+    if state[base + PACMAN]:
+      for index in self.teams[not isRed]:
+        other = self.bases[index]
+        if state[other + PACMAN] or state[other] != state[base]: continue
+        if state[other + SCARED] <= 0:
+          self.dumpFood(state, agentIndex)
+          self.sendHome(state, agentIndex)
+        else:
+          self.sendHome(state, index)
+        scoreChange += points
+    else:
+      for index in self.teams[not isRed]:
+        other = self.bases[index]
+        if not state[other + PACMAN] or state[other] != state[base]: continue
+        if state[base + SCARED] <= 0:
+          self.dumpFood(state, index)
+          self.sendHome(state, index)
+          scoreChange -= points
+        else:
+          self.sendHome(state, agentIndex)
+          scoreChange += points
+    return scoreChange
+
+  def sendHome(self, state, agentIndex):
+    base = self.bases[agentIndex]
+    state[base], state[base + DIRECTION] = self.starts[agentIndex]
+    state[base + PACMAN] = False
+    state[base + SCARED] = 0
+
+  def dumpFood(self, state, agentIndex):
+    "AgentRules.dumpFoodFromDeath: drops a dying Pacman's food around it"
+    if not capture.DUMP_FOOD_ON_DEATH: return
+    base = self.bases[agentIndex]
+    numToDump = state[base + CARRYING]
+    if numToDump == 0: return
+    food = state[FOOD]
+    blocked = food | state[CAPSULES]
+    agentCells = [state[b] for b in self.bases]
+    for cell in self.dumpOrder(state[base]):
+      if blocked >> cell & 1 or cell in agentCells: continue
+      food |= 1 << cell
+      numToDump -= 1
+      if numToDump == 0: break
+    else:
+      raise Exception('Exhausted BFS! uh oh')
+    state[FOOD] = food
+    state[base + CARRYING] = 0
+
+  def dumpOrder(self, start):
+    """
+    The cells dumpFoodFromDeath may drop food on for a Pacman dying on a
+    cell, in the order its search visits them: open cells inside the outer
+    wall on the same side as the cell.  The search never gains by leaving
+    the grid, so it is done on the grid alone, once per cell.
+    """
+    order = self.dumpOrders[start]
+    if order is None:
+      width, height = self.width, self.height
+      walls = self.layout.walls
+      side = self.redSide[start]
+      x, y = self.positions[start]
+      queue = [(x, y)]
+      seen = set(queue)
+      order = []
+      for x, y in queue:
+        cell = self.cell(x, y)
+        if 0 < x < width and 0 < y < height and not walls[x][y] and self.redSide[cell] == side:
+          order.append(cell)
+        for dx, dy in DUMP_NEIGHBOURS:
+          successor = (x + dx, y + dy)
+          if 0 <= successor[0] < width and 0 <= successor[1] < height and successor not in seen:
+            seen.add(successor)
+            queue.append(successor)
+      self.dumpOrders[start] = order
+    return order
+
+#######################
+# Differential checks #
+#######################
+
+def describeDifference(sim, expected, actual):
+  "Names the fields where two simulator states differ"
+  differences = []
+  for i, name in enumerate(FIELD_NAMES):
+    if expected[i] != actual[i]:
+      differences.append('%s %s != %s' % (name, expected[i], actual[i]))
+  for agentIndex, base in enumerate(sim.bases):
+    for i, name in enumerate(AGENT_FIELD_NAMES):
+      e, a = expected[base + i], actual[base + i]
+      if i == CELL: e, a = sim.positions[e], sim.positions[a]
+      if e != a:
+        differences.append('agent %d %s %s != %s' % (agentIndex, name, e, a))
+  return ', '.join(differences)
+
+def compareTrajectory(gameState, moves):
+  """
+  Plays (agentIndex, action) moves from a GameState with both the rules
+  and a Simulator, and returns None if the states match after every move,
+  or else a description of the first move where they differ.
+  """
+  sim = Simulator(gameState)
+  state = sim.fromGameState(gameState)
+  for move, (agentIndex, action) in enumerate(moves):
+    gameState = gameState.generateSuccessor(agentIndex, action)
+    sim.step(state, agentIndex, ACTION_CODES[action])
+    expected = sim.fromGameState(gameState)
+    if expected != state:
+      return 'move %d (agent %d %s): %s' % (move, agentIndex, action, describeDifference(sim, expected, state))
+  if sim.toGameState(state) != gameState:
+    return 'the final state converts to a different GameState'
+  return None
+
+def randomGame(layout, seed, length = 1200, numAgents = 4):
+  """
+  Plays a game of agents that wander at random, rarely stopping or turning
+  back, and returns its initial GameState and its moves.
+  """
+  from captureReplay import initialState
+  rand = random.Random(seed)
+  gameState = initialState(layout, numAgents, length)
+  start = gameState
+  moves = []
+  agentIndex = rand.randrange(numAgents)
+  while len(moves) < length and not gameState.isOver():
+    actions = gameState.getLegalActions(agentIndex)
+    direction = gameState.data.agentStates[agentIndex].getDirection()
+    choices = [a for a in actions if a != 'Stop' and a != Actions.reverseDirection(direction)]
+    if not choices or rand.random() < 0.1: choices = actions
+    action = rand.choice(choices)
+    moves.append((agentIndex, action))
+    gameState = gameState.generateSuccessor(agentIndex, action)
+    agentIndex = (agentIndex + 1) % numAgents
+  return start, moves
+
+def verifyReplay(path):
+  from captureReplay import loadReplay
+  replay = loadReplay(path)
+  return compareTrajectory(replay.stateAt(0), replay.moves)
+
+def verifyRandomGame(layout, seed):
+  return compareTrajectory(*randomGame(layout, seed))
+
+def readCommand(argv):
+  from optparse import OptionParser
+  usageStr = """
+  USAGE:      python captureSimulator.py <options> <replay> ...
+  EXAMPLES:   (1) python captureSimulator.py replay-*
+                  - plays every replay with both the simulator and the rules
+                    and reports any move where their states differ
+              (2) python captureSimulator.py -l defaultCapture,RANDOM13 -n 20
+                  - does the same for 20 random games on each layout
+  """
+  parser = OptionParser(usageStr)
+  parser.add_option('-l', '--layouts', default='',
+                    help='Comma separated layouts to play random games on, RANDOM<seed> for random mazes')
+  parser.add_option('-n', '--numGames', type='int', default=10,
+                    help='Number of random games per layout (default: %default)')
+  parser.add_option('--seed', type='int', default=0,
+                    help='Seed of the first random game (default: %default)')
+  options, paths = parser.parse_args(argv)
+  if len(paths) == 0 and not options.layouts:
+    parser.error('No replay files or layouts given')
+  return options, paths
+
+if __name__ == '__main__':
+  import layout as layoutModule
+  options, paths = readCommand(sys.argv[1:])
+  checks = [(path, verifyReplay, (path,)) for path in paths]
+  for name in [name for name in options.layouts.split(',') if name]:
+    if name.startswith('RANDOM'):
+      l = layoutModule.Layout(capture.randomLayout(int(name[6:])).split('\n'))
+    else:
+      l = layoutModule.getLayout(name)
+    if l is None: raise Exception('The layout ' + name + ' cannot be found')
+    for seed in range(options.seed, options.seed + options.numGames):
+      checks.append(('%s seed %d' % (name, seed), verifyRandomGame, (l, seed)))
+  failed = 0
+  for name, check, args in checks:
+    try:
+      difference = check(*args)
+    except Exception as e:
+      difference = '%s: %s' % (type(e).__name__, e)
+    if difference is not None:
+      failed += 1
+      print('%s: %s' % (name, difference))
+  print('%d games checked, %d differ' % (len(checks), failed))
+  sys.exit(1 if failed else 0)
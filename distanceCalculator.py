@@ -16,12 +16,24 @@
 This file contains a Distancer object which computes and
 caches the shortest path between any two points in the maze.
 
+Computed distance tables are also saved to disk (see CACHE_DIR), keyed by
+a fingerprint of the walls, so later processes playing on the same maze
+memory-map the table instead of recomputing it.  All agents of a process
+share one table, and all processes map the same file pages, so each extra
+game process only pays for the cell index, not for the distance matrix.
+
 Example:
 distancer = Distancer(gameState.data.layout)
 distancer.getDistance( (1,1), (10,10) )
 """
 
-import sys, time, random
+import sys, os, time, random
+import hashlib, mmap, struct, heapq
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+from array import array
 
 class Distancer:
   def __init__(self, layout, default = 10000):
@@ -39,7 +51,7 @@ class Distancer:
     """
     The getDistance function is the only one you'll need after you create the object.
     """
-    if self._distances == None:
+    if self._distances is None:
       return manhattanDistance(pos1, pos2)
     if isInt(pos1) and isInt(pos2):
       return self.getDistanceOnGrid(pos1, pos2)
@@ -55,14 +67,25 @@ class Distancer:
     return bestDistance
 
   def getDistanceOnGrid(self, pos1, pos2):
-    key = (pos1, pos2)
-    if key in self._distances:
-      return self._distances[key]
+    table = self._distances
+    cellIds = table.cellIds
+    if pos1 in cellIds and pos2 in cellIds:
+      distance = table.distances[cellIds[pos1] * table.numCells + cellIds[pos2]]
+      if distance == UNREACHABLE:
+        return sys.maxsize
+      return distance
     else:
-      raise Exception("Positions not in grid: " + str(key))
+      raise Exception("Positions not in grid: " + str((pos1, pos2)))
 
   def isReadyForMazeDistance(self):
-    return self._distances != None
+    return self._distances is not None
+
+  def getDistanceField(self, sources):
+    """
+    Returns a DistanceField with the maze distance from every open cell to
+    the nearest of the source positions.
+    """
+    return DistanceField(self.dc.layout.walls, sources, self._distances)
 
 def manhattanDistance(x, y ):
   return abs( x[0] - y[0] ) + abs( x[1] - y[1] )
@@ -90,6 +113,22 @@ def getGrids1D(x):
 
 distanceMap = {}
 
+# Directory holding the on-disk distance tables.  Set the environment
+# variable CAPTURE_DISTANCE_CACHE to move it, or to an empty string to
+# turn the disk cache off.
+CACHE_DIR = os.environ.get('CAPTURE_DISTANCE_CACHE',
+                           os.path.join(os.path.expanduser('~'), '.cache', 'capture-distances'))
+
+# Cache files start with: magic, format version, byte order, width, height,
+# number of cells.  The distance matrix follows as unsigned shorts.
+CACHE_MAGIC = b'CDST'
+CACHE_VERSION = 1
+CACHE_HEADER = struct.Struct('<4sHHIII')
+
+# Marks pairs of cells that are not connected in the maze.  Distances are
+# stored as unsigned shorts, so this is also the largest storable distance.
+UNREACHABLE = 0xFFFF
+
 class DistanceCalculator:
   def __init__(self, layout, distancer, default = 10000):
     self.layout = layout
@@ -100,58 +139,290 @@ class DistanceCalculator:
     global distanceMap
 
     if self.layout.walls not in distanceMap:
-      distances = computeDistances(self.layout)
+      distances = publishDistances(self.layout)
       distanceMap[self.layout.walls] = distances
     else:
       distances = distanceMap[self.layout.walls]
 
     self.distancer._distances = distances
 
+class DistanceTable:
+  """
+  All-pairs maze distances stored as a dense matrix.
+
+  Every open cell of the layout gets an integer id (its index in
+  walls.asList(False)), and the distance between the cells with ids i and j
+  is kept at distances[i * numCells + j] in a flat array of unsigned shorts.
+  """
+  def __init__(self, walls, distances = None):
+    self.positions = walls.asList(False)
+    self.numCells = len(self.positions)
+    self.cellIds = dict((pos, i) for i, pos in enumerate(self.positions))
+    self.neighbors = computeNeighbors(walls, self.positions, self.cellIds)
+    if distances is None:
+      distances = array('H', [UNREACHABLE]) * (self.numCells * self.numCells)
+    self.distances = distances
+
+  def __contains__(self, key):
+    pos1, pos2 = key
+    return pos1 in self.cellIds and pos2 in self.cellIds
+
+  def __getitem__(self, key):
+    pos1, pos2 = key
+    distance = self.distances[self.cellIds[pos1] * self.numCells + self.cellIds[pos2]]
+    if distance == UNREACHABLE:
+      return sys.maxsize
+    return distance
+
+  def __len__(self):
+    return self.numCells * self.numCells
+
+class DistanceField:
+  """
+  Maze distances from every open cell to the nearest of a set of source
+  cells, found with one breadth-first search started from all the sources
+  at once.  field[pos] is an O(1) lookup; wall cells raise KeyError and
+  cells cut off from every source give sys.maxsize.
+
+  Sources can be added and removed afterwards; only the cells whose
+  distance may change are searched again.
+
+  The cell ids and neighbors are taken from a DistanceTable for the same
+  walls when one is given.
+  """
+  def __init__(self, walls, sources, table = None):
+    if table is None:
+      positions = walls.asList(False)
+      self.cellIds = dict((pos, i) for i, pos in enumerate(positions))
+      self.neighbors = computeNeighbors(walls, positions, self.cellIds)
+    else:
+      self.cellIds, self.neighbors = table.cellIds, table.neighbors
+    cellIds = self.cellIds
+    self.distances = computeDistanceField(self.neighbors, [cellIds[pos] for pos in sources if pos in cellIds])
+
+  def copy(self):
+    field = DistanceField.__new__(DistanceField)
+    field.cellIds, field.neighbors = self.cellIds, self.neighbors
+    field.distances = self.distances[:]
+    return field
+
+  def addSource(self, pos):
+    """
+    Makes pos a source.  Distances can only shrink, so a BFS from pos that
+    stops wherever it does not improve on the old distance is enough.
+    """
+    distances, neighbors = self.distances, self.neighbors
+    source = self.cellIds[pos]
+    if distances[source] == 0:
+      return
+    distances[source] = 0
+    frontier = [source]
+    distance = 0
+    while frontier:
+      distance += 1
+      nextFrontier = []
+      for node in frontier:
+        for other in neighbors[node]:
+          if distances[other] > distance:
+            distances[other] = distance
+            nextFrontier.append(other)
+      frontier = nextFrontier
+
+  def removeSource(self, pos):
+    """
+    Stops pos being a source.  Only cells reached from pos by steps that
+    each add one to the distance can have had their shortest path run
+    through it; those are cleared and refilled from the cells around them.
+    """
+    distances, neighbors = self.distances, self.neighbors
+    source = self.cellIds[pos]
+    if distances[source] != 0:
+      return
+    region = [source]
+    inRegion = set(region)
+    for node in region:
+      for other in neighbors[node]:
+        if other not in inRegion and distances[other] == distances[node] + 1:
+          inRegion.add(other)
+          region.append(other)
+
+    # Distances outside the region are unchanged, so they seed the refill
+    queue = []
+    for node in region:
+      best = UNREACHABLE
+      for other in neighbors[node]:
+        if other not in inRegion and distances[other] + 1 < best:
+          best = distances[other] + 1
+      distances[node] = best
+      if best != UNREACHABLE:
+        queue.append((best, node))
+    heapq.heapify(queue)
+    while queue:
+      distance, node = heapq.heappop(queue)
+      if distance > distances[node]:
+        continue
+      for other in neighbors[node]:
+        if distances[other] > distance + 1:
+          distances[other] = distance + 1
+          heapq.heappush(queue, (distance + 1, other))
+
+  def __contains__(self, pos):
+    return pos in self.cellIds
+
+  def __getitem__(self, pos):
+    distance = self.distances[self.cellIds[pos]]
+    if distance == UNREACHABLE:
+      return sys.maxsize
+    return distance
+
+def computeNeighbors(walls, positions, cellIds):
+    "Returns, for each cell id, the tuple of ids of the adjacent open cells"
+    neighbors = []
+    for x, y in positions:
+        adjacent = []
+        for other in ((x,y+1), (x,y-1), (x+1,y), (x-1,y)):
+            if other in cellIds:
+                adjacent.append(cellIds[other])
+        neighbors.append(tuple(adjacent))
+    return neighbors
+
 def computeDistances(layout):
-    "Runs UCS to all other positions from each position"
-    distances = {}
-    allNodes = layout.walls.asList(False)
-    for source in allNodes:
-        dist = {}
-        closed = {}
-        for node in allNodes:
-            dist[node] = sys.maxsize
-        import util
-        queue = util.PriorityQueue()
-        queue.push(source, 0)
-        dist[source] = 0
-        while not queue.isEmpty():
-            node = queue.pop()
-            if node in closed:
-                continue
-            closed[node] = True
-            nodeDist = dist[node]
-            adjacent = []
-            x, y = node
-            if not layout.isWall((x,y+1)):
-                adjacent.append((x,y+1))
-            if not layout.isWall((x,y-1)):
-                adjacent.append((x,y-1) )
-            if not layout.isWall((x+1,y)):
-                adjacent.append((x+1,y) )
-            if not layout.isWall((x-1,y)):
-                adjacent.append((x-1,y))
-            for other in adjacent:
-                if not other in dist:
-                    continue
-                oldDist = dist[other]
-                newDist = nodeDist+1
-                if newDist < oldDist:
-                    dist[other] = newDist
-                    queue.push(other, newDist)
-        for target in allNodes:
-            distances[(target, source)] = dist[target]
-    return distances
+    "Runs BFS to all other positions from each position"
+    table = DistanceTable(layout.walls)
+    numCells, neighbors = table.numCells, table.neighbors
+    for source in range(numCells):
+        row = [UNREACHABLE] * numCells
+        row[source] = 0
+        frontier = [source]
+        distance = 0
+        while frontier:
+            distance += 1
+            nextFrontier = []
+            for node in frontier:
+                for other in neighbors[node]:
+                    if row[other] == UNREACHABLE:
+                        row[other] = distance
+                        nextFrontier.append(other)
+            frontier = nextFrontier
+        table.distances[source * numCells:(source + 1) * numCells] = array('H', row)
+    return table
+
+def computeDistanceField(neighbors, sources):
+    "Runs a single BFS from all the source cell ids, returning the distance of every cell id"
+    field = array('H', [UNREACHABLE]) * len(neighbors)
+    frontier = []
+    for source in sources:
+        if field[source] != 0:
+            field[source] = 0
+            frontier.append(source)
+    distance = 0
+    while frontier:
+        distance += 1
+        nextFrontier = []
+        for node in frontier:
+            for other in neighbors[node]:
+                if field[other] == UNREACHABLE:
+                    field[other] = distance
+                    nextFrontier.append(other)
+        frontier = nextFrontier
+    return field
+
+def wallsFingerprint(walls):
+    "Returns a hash of the walls that is stable across processes and runs"
+    text = '%d,%d\n%s' % (walls.width, walls.height, str(walls))
+    return hashlib.sha1(text.encode('ascii')).hexdigest()
 
+def getCachePath(walls):
+    if not CACHE_DIR:
+        return None
+    return os.path.join(CACHE_DIR, wallsFingerprint(walls) + '.dist')
+
+def loadDistances(walls):
+    """
+    Memory-maps the cached DistanceTable for these walls.  Returns None if
+    there is no usable cache file.
+    """
+    path = getCachePath(walls)
+    if path is None or not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (IOError, OSError, ValueError):
+        return None
+    numCells = walls.count(False)
+    if len(data) != CACHE_HEADER.size + 2 * numCells * numCells:
+        return None
+    header = CACHE_HEADER.unpack_from(data)
+    if header != (CACHE_MAGIC, CACHE_VERSION, sys.byteorder == 'little', walls.width, walls.height, numCells):
+        return None
+    return DistanceTable(walls, memoryview(data)[CACHE_HEADER.size:].cast('H'))
+
+def saveDistances(table, walls):
+    """
+    Writes the table to the disk cache.  The cache is only an optimization,
+    so failures to write it are ignored.
+    """
+    path = getCachePath(walls)
+    if path is None:
+        return
+    header = CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, sys.byteorder == 'little',
+                               walls.width, walls.height, table.numCells)
+    tmpPath = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(tmpPath, 'wb') as f:
+            f.write(header)
+            f.write(table.distances)
+        # Readers only ever see complete files
+        os.replace(tmpPath, path)
+    except (IOError, OSError):
+        try:
+            os.remove(tmpPath)
+        except OSError:
+            pass
+
+def publishDistances(layout):
+    """
+    Returns the DistanceTable for the layout, shared with every other process
+    using the same cache directory.  The first process to get here computes
+    and publishes the table while holding a lock on it; the others wait for
+    it and then map the published file rather than computing their own copy.
+    """
+    walls = layout.walls
+    table = loadDistances(walls)
+    if table is not None:
+        return table
+    path = getCachePath(walls)
+    lock = None
+    if path is not None and fcntl is not None:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            lock = open(path + '.lock', 'w')
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        except (IOError, OSError):
+            # Carry on unlocked, without leaking the handle if flock failed
+            if lock is not None:
+                lock.close()
+            lock = None
+    try:
+        # Another process may have published while we waited for the lock
+        table = loadDistances(walls)
+        if table is None:
+            table = computeDistances(layout)
+            saveDistances(table, walls)
+            # Drop our private copy in favour of the shared pages
+            published = loadDistances(walls)
+            if published is not None:
+                table = published
+    finally:
+        if lock is not None:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+    return table
 
 def getDistanceOnGrid(distances, pos1, pos2):
     key = (pos1, pos2)
     if key in distances:
       return distances[key]
     return 100000
-
@@ -75,6 +75,8 @@ class Configuration:
     The convention for positions, like a graph, is that (0,0) is the lower left corner, x increases
     horizontally and y increases vertically.  Therefore, north is the direction of increasing y, or (0,1).
     """
+    # Search makes millions of these, so they have no per-instance __dict__
+    __slots__ = ('pos', 'direction')
 
     def __init__(self, pos, direction):
         self.pos = pos
@@ -121,6 +123,8 @@ class AgentState:
     """
     AgentStates hold the state of an agent (configuration, speed, scared, etc).
     """
+    # Every successor state copies all of these, so they have no per-instance __dict__
+    __slots__ = ('start', 'configuration', 'isPacman', 'scaredTimer', 'numCarrying', 'numReturned')
 
     def __init__( self, startConfiguration, isPacman ):
         self.start = startConfiguration
@@ -145,7 +149,10 @@ class AgentState:
         return hash(hash(self.configuration) + 13 * hash(self.scaredTimer))
 
     def copy( self ):
-        state = AgentState( self.start, self.isPacman )
+        # Skips __init__, which would set most fields twice
+        state = AgentState.__new__( AgentState )
+        state.start = self.start
+        state.isPacman = self.isPacman
         state.configuration = self.configuration
         state.scaredTimer = self.scaredTimer
         state.numCarrying = self.numCarrying
@@ -280,6 +287,132 @@ def reconstituteGrid(bitRep):
     width, height = bitRep[:2]
     return Grid(width, height, bitRepresentation= bitRep[2:])
 
+class BitGrid:
+    """
+    A 2-dimensional array of booleans packed into the bits of one integer,
+    with the same grid[x][y] interface as Grid.  Cell (x,y) is bit
+    x * height + y, so bits are in the same order as Grid.asList().
+
+    Because the integer is immutable, copy() only allocates the wrapper,
+    hashing is cached, count() is a popcount and asList() visits only the
+    cells it returns.  Note that shallowCopy() is also an independent copy.
+    """
+    def __init__(self, width, height, initialValue=False, bits=None):
+        if initialValue not in [False, True]: raise Exception('Grids can only contain booleans')
+        self.width = width
+        self.height = height
+        if bits is None:
+            bits = (1 << (width * height)) - 1 if initialValue else 0
+        self.bits = bits
+        self._hash = None
+
+    def __getitem__(self, x):
+        if x < 0: x += self.width
+        if x < 0 or x >= self.width: raise IndexError('grid index out of range')
+        return BitGridColumn(self, x * self.height)
+
+    def __iter__(self):
+        for x in range(self.width):
+            yield BitGridColumn(self, x * self.height)
+
+    def __len__(self):
+        return self.width
+
+    def __str__(self):
+        out = [[str(self[x][y])[0] for x in range(self.width)] for y in range(self.height)]
+        out.reverse()
+        return '\n'.join([''.join(x) for x in out])
+
+    def __eq__(self, other):
+        if other == None: return False
+        if isinstance(other, BitGrid):
+            return self.bits == other.bits and self.width == other.width and self.height == other.height
+        return self.data == other.data
+
+    def __hash__(self):
+        # Same value as Grid.__hash__ for the same cells
+        if self._hash is None:
+            self._hash = hash(self.bits)
+        return self._hash
+
+    def _setBit(self, index, value):
+        if value:
+            self.bits |= 1 << index
+        else:
+            self.bits &= ~(1 << index)
+        self._hash = None
+
+    def copy(self):
+        g = BitGrid(self.width, self.height, bits=self.bits)
+        g._hash = self._hash
+        return g
+
+    def deepCopy(self):
+        return self.copy()
+
+    def shallowCopy(self):
+        return self.copy()
+
+    def count(self, item =True ):
+        trueCount = bin(self.bits).count('1')
+        if item: return trueCount
+        return self.width * self.height - trueCount
+
+    def asList(self, key = True):
+        bits = self.bits
+        if not key:
+            bits ^= (1 << (self.width * self.height)) - 1
+        height = self.height
+        list = []
+        while bits:
+            lowest = bits & -bits
+            list.append(divmod(lowest.bit_length() - 1, height))
+            bits ^= lowest
+        return list
+
+    def mask(self, bits):
+        "Returns a new BitGrid holding only the cells also set in bits"
+        return BitGrid(self.width, self.height, bits=self.bits & bits)
+
+    @property
+    def data(self):
+        "The grid as a list of lists, as in Grid.data (a copy, for reading only)"
+        return [list(column) for column in self]
+
+class BitGridColumn:
+    """
+    A view of one column of a BitGrid, so that grid[x][y] reads and writes
+    the underlying bits.
+    """
+    __slots__ = ('grid', 'base')
+
+    def __init__(self, grid, base):
+        self.grid = grid
+        self.base = base
+
+    def __getitem__(self, y):
+        height = self.grid.height
+        if y < 0: y += height
+        if y < 0 or y >= height: raise IndexError('grid index out of range')
+        return (self.grid.bits >> (self.base + y)) & 1 == 1
+
+    def __setitem__(self, y, value):
+        height = self.grid.height
+        if y < 0: y += height
+        if y < 0 or y >= height: raise IndexError('grid index out of range')
+        self.grid._setBit(self.base + y, value)
+
+    def __len__(self):
+        return self.grid.height
+
+    def __iter__(self):
+        bits = self.grid.bits >> self.base
+        for y in range(self.grid.height):
+            yield (bits >> y) & 1 == 1
+
+    def count(self, item = True):
+        return list(self).count(item)
+
 ####################################
 # Parts you shouldn't have to read #
 ####################################
@@ -395,7 +528,6 @@ class GameStateData:
     def deepCopy( self ):
         state = GameStateData( self )
         state.food = self.food.deepCopy()
-        state.layout = self.layout.deepCopy()
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
         state._foodAdded = self._foodAdded
@@ -403,10 +535,7 @@ class GameStateData:
         return state
 
     def copyAgentStates( self, agentStates ):
-        copiedStates = []
-        for agentState in agentStates:
-            copiedStates.append( agentState.copy() )
-        return copiedStates
+        return [agentState.copy() for agentState in agentStates]
 
     def __eq__( self, other ):
         """
@@ -510,6 +639,68 @@ try:
 except:
     _BOINC_ENABLED = False
 
+class GameMetrics:
+    """
+    Latency histograms (see util.Histogram) of the steps of a game: per agent
+    for the calls into agent code (registerInitialState, observationFunction,
+    getAction) and for the game as a whole for the engine's own steps
+    (generateSuccessor, display, process).  Game.run fills one in as
+    game.metrics; metrics of several games can be merged and written out as
+    JSON or in the Prometheus text format.
+    """
+    AGENT_STEPS = ['registerInitialState', 'observationFunction', 'getAction']
+    ENGINE_STEPS = ['generateSuccessor', 'display', 'process']
+
+    def __init__(self):
+        self.histograms = {}
+
+    def record(self, step, seconds, agentIndex=None):
+        key = (step, agentIndex)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.add(seconds)
+
+    def merge(self, other):
+        for key, histogram in other.histograms.items():
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].merge(histogram)
+
+    def keys(self):
+        "The (step, agentIndex) keys in a stable order: agent steps first"
+        order = self.AGENT_STEPS + self.ENGINE_STEPS
+        return sorted(self.histograms, key=lambda key: (order.index(key[0]) if key[0] in order else len(order),
+                                                         key[0], -1 if key[1] is None else key[1]))
+
+    def asList(self):
+        "One dict per histogram, with its count, sum, max, quantiles and buckets"
+        rows = []
+        for step, agentIndex in self.keys():
+            histogram = self.histograms[(step, agentIndex)]
+            rows.append({'step': step, 'agent': agentIndex, 'count': histogram.count,
+                         'sum': histogram.total, 'max': histogram.max,
+                         'p50': histogram.quantile(0.5), 'p90': histogram.quantile(0.9),
+                         'p99': histogram.quantile(0.99),
+                         'buckets': [[bound, count] for bound, count in zip(Histogram.BOUNDS + (None,), histogram.counts)]})
+        return rows
+
+    def prometheusText(self, name='capture_step_seconds'):
+        lines = ['# HELP %s Time taken by each step of the game, per agent for calls into agent code.' % name,
+                 '# TYPE %s histogram' % name]
+        for step, agentIndex in self.keys():
+            histogram = self.histograms[(step, agentIndex)]
+            labels = 'step="%s"' % step
+            if agentIndex is not None: labels += ',agent="%d"' % agentIndex
+            seen = 0
+            for bound, count in zip(Histogram.BOUNDS, histogram.counts):
+                seen += count
+                lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, repr(bound), seen))
+            lines.append('%s_bucket{%s,le="+Inf"} %d' % (name, labels, histogram.count))
+            lines.append('%s_sum{%s} %r' % (name, labels, histogram.total))
+            lines.append('%s_count{%s} %d' % (name, labels, histogram.count))
+        return '\n'.join(lines) + '\n'
+
 class Game:
     """
     The Game manages the control flow, soliciting actions from agents.
@@ -517,6 +708,7 @@ class Game:
 
     def __init__( self, agents, display, rules, startingIndex=0, muteAgents=False, catchExceptions=False ):
         self.agentCrashed = False
+        self.crashedAgent = None
         self.agents = agents
         self.display = display
         self.rules = rules
@@ -528,6 +720,8 @@ class Game:
         self.totalAgentTimes = [0 for agent in agents]
         self.totalAgentTimeWarnings = [0 for agent in agents]
         self.agentTimeout = False
+        self.watchdog = Watchdog()
+        self.metrics = GameMetrics()
         import io
         self.agentOutput = [io.StringIO() for agent in agents]
 
@@ -542,6 +736,7 @@ class Game:
         if not quiet: traceback.print_exc()
         self.gameOver = True
         self.agentCrashed = True
+        self.crashedAgent = agentIndex
         self.rules.agentCrash(self, agentIndex)
 
     OLD_STDOUT = None
@@ -568,6 +763,14 @@ class Game:
         """
         Main control loop for game play.
         """
+        # one SIGALRM handler for the whole game; each call to an agent only arms a timer
+        if self.catchExceptions: self.watchdog.install()
+        try:
+            self._run()
+        finally:
+            self.watchdog.uninstall()
+
+    def _run( self ):
         self.display.initialize(self.state.data)
         self.numMoves = 0
 
@@ -587,12 +790,12 @@ class Game:
                 self.mute(i)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.registerInitialState, int(self.rules.getMaxStartupTime(i)))
                         try:
                             start_time = time.time()
-                            timed_func(self.state.deepCopy())
+                            self.watchdog.call(self.rules.getMaxStartupTime(i), agent.registerInitialState, self.state.deepCopy())
                             time_taken = time.time() - start_time
                             self.totalAgentTimes[i] += time_taken
+                            self.metrics.record('registerInitialState', time_taken, i)
                         except TimeoutFunctionException:
                             print("Agent %d ran out of time on startup!" % i, file=sys.stderr)
                             self.unmute()
@@ -604,7 +807,9 @@ class Game:
                         self.unmute()
                         return
                 else:
+                    start_time = time.time()
                     agent.registerInitialState(self.state.deepCopy())
+                    self.metrics.record('registerInitialState', time.time() - start_time, i)
                 ## TODO: could this exceed the total time
                 self.unmute()
 
@@ -621,35 +826,36 @@ class Game:
                 self.mute(agentIndex)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.observationFunction, int(self.rules.getMoveTimeout(agentIndex)))
                         try:
                             start_time = time.time()
-                            observation = timed_func(self.state.deepCopy())
+                            observation = self.watchdog.call(self.rules.getMoveTimeout(agentIndex), agent.observationFunction, self.state.readOnlyView())
                         except TimeoutFunctionException:
                             skip_action = True
                         move_time += time.time() - start_time
+                        self.metrics.record('observationFunction', move_time, agentIndex)
                         self.unmute()
                     except Exception as data:
                         self._agentCrash(agentIndex, quiet=False)
                         self.unmute()
                         return
                 else:
-                    observation = agent.observationFunction(self.state.deepCopy())
+                    start_time = time.time()
+                    observation = agent.observationFunction(self.state.readOnlyView())
+                    self.metrics.record('observationFunction', time.time() - start_time, agentIndex)
                 self.unmute()
             else:
-                observation = self.state.deepCopy()
+                observation = self.state.readOnlyView()
 
             # Solicit an action
             action = None
             self.mute(agentIndex)
             if self.catchExceptions:
                 try:
-                    timed_func = TimeoutFunction(agent.getAction, int(self.rules.getMoveTimeout(agentIndex)) - int(move_time))
                     try:
                         start_time = time.time()
                         if skip_action:
                             raise TimeoutFunctionException()
-                        action = timed_func( observation )
+                        action = self.watchdog.call(self.rules.getMoveTimeout(agentIndex) - move_time, agent.getAction, observation)
                     except TimeoutFunctionException:
                         print("Agent %d timed out on a single move!" % agentIndex, file=sys.stderr)
                         self.agentTimeout = True
@@ -657,7 +863,9 @@ class Game:
                         self.unmute()
                         return
 
-                    move_time += time.time() - start_time
+                    action_time = time.time() - start_time
+                    self.metrics.record('getAction', action_time, agentIndex)
+                    move_time += action_time
 
                     if move_time > self.rules.getMoveWarningTime(agentIndex):
                         self.totalAgentTimeWarnings[agentIndex] += 1
@@ -683,11 +891,14 @@ class Game:
                     self.unmute()
                     return
             else:
+                start_time = time.time()
                 action = agent.getAction(observation)
+                self.metrics.record('getAction', time.time() - start_time, agentIndex)
             self.unmute()
 
             # Execute the action
             self.moveHistory.append( (agentIndex, action) )
+            step_time = time.time()
             if self.catchExceptions:
                 try:
                     self.state = self.state.generateSuccessor( agentIndex, action )
@@ -699,13 +910,19 @@ class Game:
             else:
                 self.state = self.state.generateSuccessor( agentIndex, action )
 
+            self.metrics.record('generateSuccessor', time.time() - step_time)
+
             # Change the display
+            step_time = time.time()
             self.display.update( self.state.data )
+            self.metrics.record('display', time.time() - step_time)
             ###idx = agentIndex - agentIndex % 2 + 1
             ###self.display.update( self.state.makeObservation(idx).data )
 
             # Allow for game specific conditions (winning, losing, etc.)
+            step_time = time.time()
             self.rules.process(self.state, self)
+            self.metrics.record('process', time.time() - step_time)
             # Track progress
             if agentIndex == numAgents + 1: self.numMoves += 1
             # Next agent
@@ -13,7 +13,7 @@
 
 
 from util import manhattanDistance
-from game import Grid
+from game import Grid, BitGrid
 import os
 import random
 from functools import reduce
@@ -23,13 +23,18 @@ VISIBILITY_MATRIX_CACHE = {}
 class Layout:
     """
     A Layout manages the static information about the game board.
+
+    Layouts are never modified once built, so game states and observations
+    all share the same Layout object rather than copying it.
     """
+    # (x, y) -> tuple of the actions possible there, made by getLegalActionTable
+    legalActions = None
 
     def __init__(self, layoutText):
         self.width = len(layoutText[0])
         self.height= len(layoutText)
         self.walls = Grid(self.width, self.height, False)
-        self.food = Grid(self.width, self.height, False)
+        self.food = BitGrid(self.width, self.height, False)
         self.capsules = []
         self.agentPositions = []
         self.numGhosts = 0
@@ -41,6 +46,20 @@ class Layout:
     def getNumGhosts(self):
         return self.numGhosts
 
+    def getLegalActionTable(self):
+        """
+        Returns a dict from each open cell (x, y) to the tuple of actions an
+        agent standing there can take, in the order of
+        Actions.getPossibleActions.  It is made once per layout.
+        """
+        if self.legalActions is None:
+            from game import Actions, Configuration, Directions
+            table = {}
+            for x, y in self.walls.asList(False):
+                table[(x, y)] = tuple(Actions.getPossibleActions(Configuration((x, y), Directions.STOP), self.walls))
+            self.legalActions = table
+        return self.legalActions
+
     def initializeVisibilityMatrix(self):
         global VISIBILITY_MATRIX_CACHE
         if reduce(str.__add__, self.layoutText) not in VISIBILITY_MATRIX_CACHE:
@@ -91,7 +110,8 @@ class Layout:
         return "\n".join(self.layoutText)
 
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        # Layouts are immutable, so there is nothing to copy
+        return self
 
     def processLayoutText(self, layoutText):
         """
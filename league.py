@@ -0,0 +1,218 @@
+# league.py
+# ---------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Round-robin leagues between capture teams.
+
+Every pair of teams meets on every layout with every seed, once with each
+team playing red, and the standings are printed at the end:
+
+  > python league.py -t myTeam,baselineTeam,otherTeam -l defaultCapture,RANDOM13 -s 3
+
+Games are spread over a pool of processes (--parallel) and each finished
+game is appended to a journal file.  Running the same command again after
+an interruption only plays the games missing from the journal.
+"""
+
+import sys, os, json, math, random
+import capture
+
+def getLayout(name):
+  import layout
+  if name.startswith('RANDOM'):
+    return layout.Layout(capture.randomLayout(int(name[6:])).split('\n'))
+  l = layout.getLayout(name)
+  if l == None: raise Exception("The layout " + name + " cannot be found")
+  return l
+
+def teamName(team):
+  return os.path.basename(team)[:-3] if team.endswith('.py') else os.path.basename(team)
+
+def schedule(teams, layouts, seeds):
+  """
+  Returns the games of the league as (red, blue, layout, seed) tuples: every
+  pair of teams on every layout and seed, with each team playing red once.
+  """
+  games = []
+  for i, first in enumerate(teams):
+    for second in teams[i + 1:]:
+      for layoutName in layouts:
+        for seed in seeds:
+          games.append((first, second, layoutName, seed))
+          games.append((second, first, layoutName, seed))
+  return games
+
+def gameKey(game, length, catchExceptions):
+  """
+  The journal key of a game: its teams, layout and seed, and the rule
+  options that change its result, so that a league resumed with other
+  options does not reuse results played under the old ones.
+  """
+  return '%s|%s|%s|%d|%s|%s' % (game + (length, catchExceptions))
+
+def resultKey(result):
+  # journal lines written before the options were recorded match no game
+  return gameKey((result['red'], result['blue'], result['layout'], result['seed']),
+                 result.get('length'), result.get('catchExceptions'))
+
+def readJournal(path):
+  """
+  Returns the results recorded in the journal, by game key.  A line cut
+  short by a crash is ignored, so that game is simply played again.
+  """
+  results = {}
+  if not os.path.exists(path):
+    return results
+  with open(path) as f:
+    for line in f:
+      try:
+        result = json.loads(line)
+      except ValueError:
+        continue
+      results[resultKey(result)] = result
+  return results
+
+def playLeagueGame(job):
+  "Plays one league game in a worker process and returns its result"
+  import io, contextlib
+  (red, blue, layoutName, seed), length, catchExceptions = job
+  teams = (red, {}, blue, {})
+  with contextlib.redirect_stdout(io.StringIO()):
+    g = capture.playParallelGame((0, getLayout(layoutName), teams, length, False,
+                                  teamName(red), teamName(blue), True, catchExceptions, seed))
+  return {'red': red, 'blue': blue, 'layout': layoutName, 'seed': seed,
+          'length': length, 'catchExceptions': catchExceptions, 'score': g.state.data.score, 'moves': len(g.moveHistory), 'crashed': g.agentCrashed}
+
+def runLeague(teams, layouts, seeds, journal, length = 1200, parallel = 1, catchExceptions = True):
+  """
+  Plays every game of the league that is not already in the journal and
+  returns the results of all of them.
+  """
+  import multiprocessing
+  results = readJournal(journal)
+  league = schedule(teams, layouts, seeds)
+  games = [game for game in league if gameKey(game, length, catchExceptions) not in results]
+  print('%d games played, %d to play' % (len(league) - len(games), len(games)))
+
+  jobs = [(game, length, catchExceptions) for game in games]
+  pool = multiprocessing.Pool(max(1, min(parallel, len(games))))
+  try:
+    with open(journal, 'a+') as f:
+      # finish a line cut short by a crash, so the next result starts afresh
+      if f.tell() > 0:
+        f.seek(f.tell() - 1)
+        if f.read(1) != '\n': f.write('\n')
+      for result in pool.imap_unordered(playLeagueGame, jobs):
+        # One complete line per game, on disk before the next is counted
+        f.write(json.dumps(result) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+        results[resultKey(result)] = result
+        print('%s (red) vs %s (blue) on %s, seed %d: %s' % (teamName(result['red']), teamName(result['blue']),
+                                                            result['layout'], result['seed'], result['score']))
+  finally:
+    pool.terminate()
+  # the journal may also hold games of other leagues
+  return [results[gameKey(game, length, catchExceptions)] for game in league]
+
+def wilsonInterval(points, games, z = 1.96):
+  "95% Wilson score interval of a win rate (ties count as half a win)"
+  if games == 0:
+    return 0.0, 1.0
+  p = points / float(games)
+  center = (p + z * z / (2 * games)) / (1 + z * z / games)
+  spread = z * math.sqrt(p * (1 - p) / games + z * z / (4 * games * games)) / (1 + z * z / games)
+  return max(0.0, center - spread), min(1.0, center + spread)
+
+def standings(teams, results):
+  """
+  Returns one row per team, best first: name, games, wins, ties, losses,
+  win rate, the 95% interval of the win rate and the average score margin.
+  """
+  rows = []
+  for team in teams:
+    wins = ties = losses = 0
+    margin = 0
+    for result in results:
+      if team not in (result['red'], result['blue']): continue
+      score = result['score'] if team == result['red'] else -result['score']
+      margin += score
+      if score > 0: wins += 1
+      elif score < 0: losses += 1
+      else: ties += 1
+    games = wins + ties + losses
+    points = wins + 0.5 * ties
+    low, high = wilsonInterval(points, games)
+    rows.append((teamName(team), games, wins, ties, losses,
+                 points / float(games) if games else 0.0, low, high, margin / float(games) if games else 0.0))
+  rows.sort(key = lambda row: (-row[5], -row[8]))
+  return rows
+
+def formatStandings(rows):
+  header = ['team', 'games', 'won', 'tied', 'lost', 'win rate', '95% interval', 'margin']
+  cells = [[name, str(games), str(wins), str(ties), str(losses), '%.3f' % rate,
+            '%.3f-%.3f' % (low, high), '%+.2f' % margin]
+           for name, games, wins, ties, losses, rate, low, high, margin in rows]
+  widths = [max(len(row[i]) for row in [header] + cells) for i in range(len(header))]
+  return '\n'.join('  '.join(cell.rjust(width) for cell, width in zip(row, widths)) for row in [header] + cells)
+
+def readCommand(argv):
+  from optparse import OptionParser
+  usageStr = """
+  USAGE:      python league.py -t <team>,<team>,... <options>
+  EXAMPLES:   (1) python league.py -t myTeam,baselineTeam
+                  - plays myTeam against baselineTeam on defaultCapture, once on each side
+              (2) python league.py -t myTeam,baselineTeam,otherTeam -l defaultCapture,RANDOM13 -s 5 --parallel 8
+                  - a three team league on two layouts with five seeds per pairing, eight games at a time
+  """
+  parser = OptionParser(usageStr)
+  parser.add_option('-t', '--teams', default='',
+                    help='Comma separated team modules (at least two)')
+  parser.add_option('-l', '--layouts', default='defaultCapture',
+                    help=capture.default('Comma separated layouts (RANDOM for a random maze, RANDOM<seed> for a given one)'))
+  parser.add_option('-s', '--seeds', type='int', default=1,
+                    help=capture.default('Number of random seeds per pairing and layout'))
+  parser.add_option('-i', '--time', type='int', dest='time', default=1200,
+                    help=capture.default('TIME limit of a game in moves'), metavar='TIME')
+  parser.add_option('--parallel', type='int', default=os.cpu_count() or 1, metavar='N',
+                    help=capture.default('Number of games played at once'))
+  parser.add_option('-j', '--journal', default='league.journal',
+                    help=capture.default('File the results are appended to; games already in it are not played again'))
+  parser.add_option('-o', '--output', default=None,
+                    help='Also write the standings table to this file')
+  options, otherjunk = parser.parse_args(argv)
+  if len(otherjunk) != 0:
+    parser.error('Unrecognized options: ' + str(otherjunk))
+  teams = [team if team.endswith('.py') else team + '.py' for team in options.teams.split(',') if team]
+  if len(teams) < 2:
+    parser.error('A league needs at least two teams')
+  layouts = []
+  for name in options.layouts.split(','):
+    if name == 'RANDOM':
+      # the journal needs the maze's seed to tell its games apart
+      name = 'RANDOM%d' % random.randint(1, 99999999)
+      print('Playing RANDOM as %s; use that name to resume this league' % name)
+    if name: layouts.append(name)
+  return options, teams, layouts
+
+if __name__ == '__main__':
+  options, teams, layouts = readCommand(sys.argv[1:])
+  results = runLeague(teams, layouts, list(range(options.seeds)), options.journal,
+                      options.time, options.parallel)
+  table = formatStandings(standings(teams, results))
+  print('')
+  print(table)
+  if options.output:
+    with open(options.output, 'w') as f:
+      f.write(table + '\n')
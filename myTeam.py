@@ -18,14 +18,16 @@ import random, time, util
 from game import Directions
 from util import nearestPoint
 import game, capture
-import sys
+import sys, math
+import captureSimulator
+from captureSimulator import SCORE, CARRYING
 
 #################
 # Team creation #
 #################
 
 def createTeam(firstIndex, secondIndex, isRed,
-               first = 'AttackAgent', second = 'DefendAgent'):
+               first = 'AttackAgent', second = 'DefendAgent', searchTime = None, printSearch = None):
   """
   This function should return a list of two agents that will form the
   team, initialized using firstIndex and secondIndex as their agent
@@ -39,10 +41,22 @@ def createTeam(firstIndex, secondIndex, isRed,
   For the contest, however, your team will be created without
   any extra arguments, so you should make sure that the default
   behavior is what you want for the nightly contest.
+
+  searchTime (e.g. --redOpts searchTime=0.3) overrides the number of
+  seconds AttackAgent and MCTSAgent spend searching each move, and
+  printSearch=1 makes MCTSAgent print its playouts per second and tree
+  size every move (e.g. --redOpts first=MCTSAgent,printSearch=1).
   """
 
   # The following line is an example only; feel free to change it.
-  return [eval(first)(firstIndex), eval(second)(secondIndex)]
+  agents = [eval(first)(firstIndex), eval(second)(secondIndex)]
+  if searchTime is not None:
+    for agent in agents:
+      agent.searchTime = float(searchTime)
+  if printSearch is not None:
+    for agent in agents:
+      agent.printSearch = printSearch not in ['0', 'False', 'false', '']
+  return agents
 
 ##########
 # Agents #
@@ -55,7 +69,39 @@ def createTeam(firstIndex, secondIndex, isRed,
 # START OF OFFENSE
 
 
+def ignoreLap(name):
+  pass
+
+def getBoundaryDistances(distancer, walls, red):
+  """
+  Returns a DistanceField with the maze distance from every cell to the
+  nearest open cell of the boundary column for the given team color:
+  x = width/2 for red and width/2 - 1 for blue, the columns AttackAgent
+  heads for to get home.  Either color can be asked for, so a defender
+  can also measure how far invaders are from escaping.
+  """
+  if red:
+    x = int(walls.width / 2)
+  else:
+    x = int(walls.width / 2) - 1
+  return distancer.getDistanceField([(x, y) for y in range(walls.height) if not walls[x][y]])
+
+class SearchTimeout(Exception):
+  """
+  Raised inside the search tree when the move's deadline has passed.
+  """
+  pass
+
 class AttackAgent(CaptureAgent):
+  # seconds of search per move; the game warns after 1 and forfeits after 3
+  searchTime = 0.6
+  # deepest search tried, in rounds of one move by every agent
+  maxDepth = 10
+  # states whose features are kept; the cache is emptied when it fills up
+  featureCacheSize = 20000
+  # time each feature into featureProfile (see 'python benchmarks.py features')
+  profileFeatures = False
+
   def registerInitialState(self, gameState: capture.GameState):
     self.start = gameState.getAgentPosition(self.index)
     self.initialFoodCount = len(self.getFood(gameState).asList())
@@ -64,11 +110,22 @@ class AttackAgent(CaptureAgent):
     self.foodEaten = 0
     self.gridLength = gameState.getWalls().width
     self.gridHeight = gameState.getWalls().height
-    self.depth = 2 # for running minimax
+    self.depth = 2 # for running minimax, raised move by move in chooseAction
+    self.deadline = None
+    # instrumentation: (depth completed, nodes searched, seconds) per move
+    self.lastDepth = 0
+    self.nodesSearched = 0
+    self.searchLog = []
+    self.featureCache = {}
+    self.leavesEvaluated = 0
+    self.featureProfile = util.Counter()
     self.team = self.getTeam(gameState)
     self.otherTeam = [2, 0] if self.team == [1, 3] else [1, 3]
     self.path = self.pathToBoundary(gameState)
+    # search results, kept from move to move since positions repeat
+    self.transpositionTable = util.TranspositionTable()
     CaptureAgent.registerInitialState(self, gameState)
+    self.homeDistances = getBoundaryDistances(self.distancer, gameState.getWalls(), self.red)
 
   def chooseAction(self, gameState: capture.GameState):
     # at the start of the game, go to the boundary
@@ -76,28 +133,74 @@ class AttackAgent(CaptureAgent):
       return self.path.pop(0)
   
     # choose best action (driven by self.evaluate)
+    self.transpositionTable.newSearch()
+    # build the food field once; the search's copies of the state share it
+    self.getFoodDistances(gameState)
+    start = time.time()
+    self.nodesSearched = 0
+    self.lastDepth = 0
     actions = gameState.getLegalActions(self.index)
-    values = [self.evaluate(gameState, a) for a in actions]
-    maxValue = max(values)
-    bestActions = [a for a, v in zip(actions, values) if v == maxValue]
+    bestActions = actions
+
+    # iterative deepening: search one round deeper until time runs out, and
+    # keep the answer of the deepest search that finished. The first search
+    # always finishes, so there is an answer even on a slow machine.
+    self.deadline = None
+    for depth in range(1, self.maxDepth + 1):
+      self.depth = depth
+      try:
+        values = [self.evaluate(gameState, a) for a in actions]
+      except SearchTimeout:
+        break
+      maxValue = max(values)
+      bestActions = [a for a, v in zip(actions, values) if v == maxValue]
+      self.lastDepth = depth
+      # search the best moves first next time, so pruning cuts more
+      actions = bestActions + [a for a in actions if a not in bestActions]
+      self.deadline = start + self.searchTime
+
+      # a deeper search is unlikely to finish if this one took the rest of the time
+      if time.time() - start > self.searchTime / 2:
+        break
+    self.deadline = None
+
+    self.searchLog.append((self.lastDepth, self.nodesSearched, time.time() - start))
     bestAction = random.choice(bestActions)
     return bestAction
   
   def evaluate(self, gameState: capture.GameState, action):
-    successor = self.getSuccessor(gameState, self.index, action)
-    return self.maxValue(successor, -sys.maxsize, sys.maxsize, self.index, 0)[0]
+    # search on a private copy, the tree is walked by changing it in place
+    state = gameState.deepCopy()
+    self.applySuccessor(state, self.index, action)
+    return self.maxValue(state, -sys.maxsize, sys.maxsize, self.index, 0)[0]
 
   def maxValue(self, gameState, alpha, beta, index, depth):
+    self.nodesSearched += 1
+    if self.deadline is not None and time.time() > self.deadline:
+      raise SearchTimeout()
+
     # terminate
     if depth == self.depth or gameState.isOver():
       return (self.evaluateState(gameState, index), "")
+
+    # reuse an earlier search of this position
+    key = self.searchKey(gameState, index)
+    entry = self.transpositionTable.lookup(key)
+    result = self.probe(entry, alpha, beta, depth)
+    if result is not None:
+      return result
+    alphaOrig = alpha
         
     # find the maximum utility
     maxV = -sys.maxsize
     maxAction = ""
-    for action in gameState.getLegalActions(index):  
+    for action in self.orderedActions(gameState, index, entry):
         # call the first ghost   
-        minPredictedVal = self.minValue(self.getSuccessor(gameState, index, action), alpha, beta, index+1, depth)[0]
+        undo = self.applySuccessor(gameState, index, action)
+        try:
+          minPredictedVal = self.minValue(gameState, alpha, beta, index+1, depth)[0]
+        finally:
+          self.undoSuccessor(gameState, undo)
         maxV = max(maxV, minPredictedVal)
 
         # update the action that resulted in the maximum value
@@ -106,29 +209,47 @@ class AttackAgent(CaptureAgent):
 
         # prune
         if maxV > beta:
+          self.record(key, maxV, action, alphaOrig, beta, depth)
           return (maxV, action)
         alpha = max(alpha, maxV)
 
     # maxUtility, action that results in maxUtility
+    self.record(key, maxV, maxAction, alphaOrig, beta, depth)
     return (maxV, maxAction)
 
   def minValue(self, gameState, alpha, beta, index, depth):
+    self.nodesSearched += 1
+    if self.deadline is not None and time.time() > self.deadline:
+      raise SearchTimeout()
+
     # terminate
     if depth == self.depth or gameState.isOver():
       return (self.evaluateState(gameState, index), "")
+
+    # reuse an earlier search of this position
+    key = self.searchKey(gameState, index)
+    entry = self.transpositionTable.lookup(key)
+    result = self.probe(entry, alpha, beta, depth)
+    if result is not None:
+      return result
+    betaOrig = beta
         
     # find the minimum utility
     minV = sys.maxsize
     minAction = ""
-    for action in gameState.getLegalActions(index):
+    for action in self.orderedActions(gameState, index, entry):
       predictedVal = 0
 
-      # if this is the last ghost, call max
-      if index == self.otherTeam[1]:
-        predictedVal = self.maxValue(self.getSuccessor(gameState, index, action), alpha, beta, self.team[0], depth + 1)[0]
-      # if this is not the last ghost, call the next ghost
-      else:
-        predictedVal = self.minValue(self.getSuccessor(gameState, index, action), alpha, beta, self.otherTeam[1], depth)[0]
+      undo = self.applySuccessor(gameState, index, action)
+      try:
+        # if this is the last ghost, call max
+        if index == self.otherTeam[1]:
+          predictedVal = self.maxValue(gameState, alpha, beta, self.team[0], depth + 1)[0]
+        # if this is not the last ghost, call the next ghost
+        else:
+          predictedVal = self.minValue(gameState, alpha, beta, self.otherTeam[1], depth)[0]
+      finally:
+        self.undoSuccessor(gameState, undo)
       minV = min(minV, predictedVal)
 
         # update the action that resulted in the minimum utility
@@ -137,29 +258,94 @@ class AttackAgent(CaptureAgent):
 
       # prune
       if minV < alpha:
+        self.record(key, minV, action, alpha, betaOrig, depth)
         return (minV, action)
       beta = min(beta, minV)
 
     # minUtility, action that results in minUtility
+    self.record(key, minV, minAction, alpha, betaOrig, depth)
     return (minV, minAction)
+
+  def searchKey(self, gameState, index):
+    """
+    Transposition table key: the state's Zobrist hash combined with the
+    agent to move and whether the game has ended.
+    """
+    tables = capture.zobristTables(gameState)
+    key = gameState.getZobristHash() ^ tables.turn[index]
+    if gameState.isOver():
+      key ^= tables.over
+    return key
+
+  def probe(self, entry, alpha, beta, depth):
+    """
+    Returns the stored (value, action) of a transposition table entry if
+    it was searched at least as deep and settles the node within the
+    (alpha, beta) window.
+    """
+    if entry is None or entry[1] < self.depth - depth:
+      return None
+    value, flag = entry[2], entry[3]
+    if (flag == util.TranspositionTable.EXACT or
+        (flag == util.TranspositionTable.LOWER and value > beta) or
+        (flag == util.TranspositionTable.UPPER and value < alpha)):
+      return (value, entry[4])
+    return None
+
+  def orderedActions(self, gameState, index, entry):
+    """
+    Legal actions, with the best action of an earlier (shallower) search
+    of this position first.
+    """
+    actions = gameState.getLegalActions(index)
+    if entry is not None and entry[4] in actions and actions[0] != entry[4]:
+      actions.remove(entry[4])
+      actions.insert(0, entry[4])
+    return actions
+
+  def record(self, key, value, action, alpha, beta, depth):
+    if value <= alpha:
+      flag = util.TranspositionTable.UPPER
+    elif value >= beta:
+      flag = util.TranspositionTable.LOWER
+    else:
+      flag = util.TranspositionTable.EXACT
+    self.transpositionTable.store(key, self.depth - depth, value, flag, action)
   
   def evaluateState(self, state, index):
+    self.leavesEvaluated += 1
     features = self.getFeatures(state, index)
     weights = self.getWeights(state, index)
     return features * weights
-  
+
   def getFeatures(self, state, index):
+    """
+    The features of a state for the agent at index.  They are cached by the
+    state's hash, so evaluateState and getWeights compute them once per
+    leaf; the returned Counter is shared and must not be changed.
+    """
+    key = (state.getZobristHash(), index)
+    features = self.featureCache.get(key)
+    if features is None:
+      if len(self.featureCache) >= self.featureCacheSize:
+        self.featureCache.clear()
+      features = self.featureCache[key] = self.computeFeatures(state, index)
+    return features
+
+  def computeFeatures(self, state, index):
+    lap = self.featureTimer()
     features = util.Counter()
     myPos = state.getAgentPosition(index)
 
     # Compute my new score
-    foodList = self.getFood(state).asList()    
-    features['successorScore'] = -len(foodList) # or self.getScore(successor)
+    foodLeft = self.getFood(state).count()
+    features['successorScore'] = -foodLeft # or self.getScore(successor)
+    lap('successorScore')
 
     # Compute distance to the nearest food
-    if len(foodList) > 0: # This should always be True,  but better safe than sorry
-      minDistance = min([self.getMazeDistance(myPos, food) for food in foodList])
-      features['distanceToFood'] = minDistance
+    if foodLeft > 0: # This should always be True,  but better safe than sorry
+      features['distanceToFood'] = self.getFoodDistances(state)[myPos]
+    lap('distanceToFood')
 
     # Compute nearest distance to enemies - closer and further
     enemies = [state.getAgentState(i) for i in self.getOpponents(state)]
@@ -169,26 +355,46 @@ class AttackAgent(CaptureAgent):
       features['minAttackerDistance'] = min(dists)
       if len(attackers) > 1:
         features['maxAttackerDistance'] = max(dists)
+    lap('attackerDistance')
 
     # Compute distance to nearest capsule
     enemyCapsulesDistances = [self.getMazeDistance(myPos, capsule) for capsule in self.getCapsules(state)]
     if len(enemyCapsulesDistances) > 0:
       features['nearestEnemyCapsule'] = min(enemyCapsulesDistances)
+    lap('nearestEnemyCapsule')
 
     # Compute distance from home
     features['nearestDistanceFromHome'] = self.getNearestDistanceHome(state, myPos[0], myPos[1])
+    lap('nearestDistanceFromHome')
   
     # Compute number of eaten pellets
     features['carrying'] = state.getAgentState(self.index).numCarrying
+    lap('carrying')
 
     # Do we get eaten?
     features['eaten'] = 0
     for attacker in attackers:
       if self.getMazeDistance(myPos, attacker.getPosition()) <= 1:
         features['eaten'] = 1
+    lap('eaten')
 
     return features
 
+  def featureTimer(self):
+    """
+    Returns lap(name), which charges the time since the previous lap to the
+    named feature in self.featureProfile when profileFeatures is set, and
+    does nothing otherwise.
+    """
+    if not self.profileFeatures:
+      return ignoreLap
+    last = [time.perf_counter()]
+    def lap(name):
+      now = time.perf_counter()
+      self.featureProfile[name] += now - last[0]
+      last[0] = now
+    return lap
+
 
     # Special cases
       # weight of distance from home only become relevant after eating some no of food
@@ -222,19 +428,24 @@ class AttackAgent(CaptureAgent):
     else:
       return successor
     
+  def applySuccessor(self, gameState: capture.GameState, index, action):
+    """
+    In-place version of getSuccessor: moves the state to the next grid
+    position and returns the undo records for undoSuccessor.
+    """
+    undo = [gameState.applyAction(index, action)]
+    pos = gameState.getAgentState(index).getPosition()
+    if pos != nearestPoint(pos):
+      # Only half a grid position was covered
+      undo.append(gameState.applyAction(index, action))
+    return undo
+
+  def undoSuccessor(self, gameState: capture.GameState, undo):
+    for record in reversed(undo):
+      gameState.undoAction(record)
+
   def getNearestDistanceHome(self, gameState: capture.GameState, sa, sb):
-    if self.red:
-      x = int(self.gridLength / 2)
-    else:
-      x = int(self.gridLength / 2) - 1
-    
-    distances = []
-    for y in range(self.gridLength):
-      try:
-        distances.append(self.getMazeDistance((sa, sb), (x, y)))
-      except Exception:
-        distances
-    return min(distances)
+    return self.homeDistances[(sa, sb)]
 
 
     
@@ -346,7 +557,7 @@ class ReflexCaptureAgent(CaptureAgent):
     Picks among the actions with the highest Q(s,a).
     """
     actions = gameState.getLegalActions(self.index)
-    values = [self.evaluate(gameState, a) for a in actions]
+    values = self.evaluateActions(gameState, actions)
 
     maxValue = max(values)
     bestActions = [a for a, v in zip(actions, values) if v == maxValue]
@@ -386,6 +597,13 @@ class ReflexCaptureAgent(CaptureAgent):
     weights = self.getWeights(gameState, action)
     return features * weights
 
+  def evaluateActions(self, gameState: capture.GameState, actions):
+    """
+    The evaluation of each action in turn (see BatchEvaluationMixin to
+    score them in one batch)
+    """
+    return [self.evaluate(gameState, a) for a in actions]
+
   def getFeatures(self, gameState: capture.GameState, action):
     """
     Returns a counter of features for the state
@@ -444,6 +662,214 @@ class DefendAgent(ReflexCaptureAgent):
 
 
 
+#########################################################################################
+#########################################################################################
+#########################################################################################
+# MONTE CARLO TREE SEARCH
+
+def cellTable(sim, field):
+  """
+  A DistanceField as a list indexed by simulator cell, for lookups in
+  rollouts; walls and cells cut off from every source give sys.maxsize.
+  """
+  table = [sys.maxsize] * (sim.width * sim.height)
+  distances = field.distances
+  for (x, y), i in field.cellIds.items():
+    table[sim.cell(x, y)] = distances[i]
+  return table
+
+class SearchNode:
+  """
+  A node of MCTSAgent's tree: a simulator state and the agent to move in
+  it, the children expanded so far as (action, node) pairs, the actions
+  not tried yet, and the number and total value of the playouts through
+  the node, for the searching team.
+  """
+  __slots__ = ('state', 'agentIndex', 'children', 'untried', 'visits', 'value')
+
+  def __init__(self, state, agentIndex, actions):
+    self.state = state
+    self.agentIndex = agentIndex
+    self.children = []
+    self.untried = list(actions)
+    self.visits = 0
+    self.value = 0.0
+
+class MCTSAgent(CaptureAgent):
+  """
+  Monte Carlo tree search on captureSimulator.  Each level of the tree is
+  the move of the next agent in turn; UCT picks the moves of our agents to
+  raise the value and those of the opponents to lower it.  A playout adds
+  one node and then plays a short rollout in which every agent heads for
+  food, or home once it carries enough, with some random moves.  The part
+  of the tree below the move played is kept for the next move.
+  """
+  # seconds of search per move; the game warns after 1 and forfeits after 3
+  searchTime = 0.6
+  # UCT exploration constant, in points of value
+  explorationWeight = 1.0
+  # moves, of all agents, played by a rollout past the tree
+  rolloutDepth = 32
+  # chance that the default policy plays a random move
+  rolloutEpsilon = 0.2
+  # food a Pacman carries in a rollout before heading home
+  rolloutCarryLimit = 3
+  # value of food carried, and of a step towards food or home, against a point scored
+  carryingWeight = 0.5
+  distanceWeight = 0.01
+  # the tree stops growing at this many nodes; playouts go on
+  maxTreeSize = 200000
+  # print the statistics of every search (--redOpts first=MCTSAgent,printSearch=1)
+  printSearch = False
+
+  def registerInitialState(self, gameState: capture.GameState):
+    CaptureAgent.registerInitialState(self, gameState)
+    self.sim = captureSimulator.Simulator(gameState)
+    self.numAgents = gameState.getNumAgents()
+    self.onTeam = [i in self.getTeam(gameState) for i in range(self.numAgents)]
+    walls = gameState.getWalls()
+    # homeTables[isRed]: distance to the last column of that team's side
+    self.homeTables = [cellTable(self.sim, getBoundaryDistances(self.distancer, walls, not red))
+                       for red in [False, True]]
+    self.tree = None
+    self.treeSize = 0
+    # instrumentation: (playouts, tree size, seconds) per move
+    self.searchLog = []
+
+  def chooseAction(self, gameState: capture.GameState):
+    start = time.time()
+    sim = self.sim
+    state = sim.fromGameState(gameState)
+    # foodTables[isRed]: distance to the food that team eats, for rollouts
+    self.foodTables = [cellTable(sim, gameState.getRedFoodDistances()),
+                       cellTable(sim, gameState.getBlueFoodDistances())]
+    root = self.reuseTree(state)
+    if root is None:
+      root = SearchNode(state, self.index, sim.getLegalActions(state, self.index))
+      self.treeSize = 1
+
+    deadline = start + self.searchTime
+    playouts = 0
+    while playouts == 0 or time.time() < deadline:
+      self.playout(root)
+      playouts += 1
+
+    action, self.tree = max(root.children, key = lambda child: child[1].visits)
+    seconds = time.time() - start
+    self.searchLog.append((playouts, self.treeSize, seconds))
+    if self.printSearch:
+      print('MCTS agent %d: %d playouts (%.0f/s), %d nodes in the tree, %.3fs'
+            % (self.index, playouts, playouts / seconds, self.treeSize, seconds))
+    return captureSimulator.ACTIONS[action]
+
+  def reuseTree(self, state):
+    """
+    Returns the node of the last tree, below the move played, whose state
+    is the one now observed, or None if the other agents played moves the
+    tree has not expanded.  treeSize is set to the size of its subtree.
+    """
+    node, self.tree = self.tree, None
+    if node is None:
+      return None
+    frontier = [node]
+    for i in range(self.numAgents - 1):
+      frontier = [child for parent in frontier for action, child in parent.children]
+    for node in frontier:
+      if node.state == state:
+        size = 0
+        stack = [node]
+        while stack:
+          parent = stack.pop()
+          size += 1
+          stack.extend(child for action, child in parent.children)
+        self.treeSize = size
+        return node
+    return None
+
+  def playout(self, root):
+    sim = self.sim
+    node = root
+    path = [root]
+    # selection
+    while not node.untried and node.children:
+      node = self.select(node)
+      path.append(node)
+    # expansion
+    state = node.state
+    agentIndex = node.agentIndex
+    if node.untried and self.treeSize < self.maxTreeSize and not sim.isOver(state):
+      action = node.untried.pop(random.randrange(len(node.untried)))
+      state = state[:]
+      sim.step(state, agentIndex, action)
+      agentIndex = (agentIndex + 1) % self.numAgents
+      child = SearchNode(state, agentIndex, sim.getLegalActions(state, agentIndex))
+      node.children.append((action, child))
+      self.treeSize += 1
+      path.append(child)
+    # simulation and backpropagation
+    value = self.rollout(state[:], agentIndex)
+    for node in path:
+      node.visits += 1
+      node.value += value
+
+  def select(self, node):
+    "The child with the best upper confidence bound for the agent to move"
+    sign = 1 if self.onTeam[node.agentIndex] else -1
+    logVisits = math.log(node.visits)
+    weight = self.explorationWeight
+    bestBound, best = -sys.maxsize, None
+    for action, child in node.children:
+      bound = sign * child.value / child.visits + weight * math.sqrt(logVisits / child.visits)
+      if bound > bestBound:
+        bestBound, best = bound, child
+    return best
+
+  def rollout(self, state, agentIndex):
+    "Plays the default policy from a state, which it changes, and returns its value"
+    sim = self.sim
+    for i in range(self.rolloutDepth):
+      if sim.isOver(state): break
+      sim.step(state, agentIndex, self.defaultPolicy(state, agentIndex))
+      agentIndex = (agentIndex + 1) % self.numAgents
+    return self.evaluateState(state)
+
+  def defaultPolicy(self, state, agentIndex):
+    sim = self.sim
+    base = sim.bases[agentIndex]
+    cell = state[base]
+    actions = sim.legal[cell]
+    if random.random() < self.rolloutEpsilon:
+      return random.choice(actions)
+    table = self.targetTable(state, agentIndex)
+    targets = sim.targets
+    best, bestDistance = actions[0], sys.maxsize
+    for action in actions:
+      distance = table[targets[cell * 5 + action]]
+      if distance < bestDistance:
+        best, bestDistance = action, distance
+    return best
+
+  def targetTable(self, state, agentIndex):
+    "Where an agent heads in rollouts: home once it carries enough food, else food"
+    isRed = self.sim.red[agentIndex]
+    if state[self.sim.bases[agentIndex] + CARRYING] >= self.rolloutCarryLimit:
+      return self.homeTables[isRed]
+    return self.foodTables[isRed]
+
+  def evaluateState(self, state):
+    """
+    The value of a state for our team: the score, food carried and how
+    near each agent is to where it heads, each counted for one team and
+    against the other.
+    """
+    sim = self.sim
+    value = state[SCORE] if self.red else -state[SCORE]
+    for agentIndex, base in enumerate(sim.bases):
+      distance = min(self.targetTable(state, agentIndex)[state[base]], sim.width * sim.height)
+      agentValue = self.carryingWeight * state[base + CARRYING] - self.distanceWeight * distance
+      value += agentValue if self.onTeam[agentIndex] else -agentValue
+    return value
+
 class DummyAgent(CaptureAgent):
   """
   A Dummy agent to serve as an example of the necessary agent structure.
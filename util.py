@@ -14,7 +14,7 @@
 
 import sys
 import inspect
-import heapq, random
+import heapq, random, bisect
 import io
 
 
@@ -201,6 +201,52 @@ class PriorityQueueWithFunction(PriorityQueue):
         "Adds an item to the queue with priority from the priority function"
         PriorityQueue.push(self, item, self.priorityFunction(item))
 
+class TranspositionTable:
+    """
+      A fixed-size cache of search results keyed by 64-bit state hashes
+      (see capture.GameState.getZobristHash).  Each key maps to one slot;
+      an entry records the search depth below the state, the value found,
+      whether that value is EXACT or only a LOWER or UPPER bound (because
+      alpha-beta cut the search short), and the best move.
+
+      When two states share a slot, an entry from the current search is
+      only replaced by one searched at least as deeply; entries left over
+      from earlier searches (see newSearch) are always replaced.
+    """
+    EXACT, LOWER, UPPER = 0, 1, 2
+
+    def  __init__(self, size=1 << 16):
+        "size is rounded down to a power of two"
+        self.size = 1 << (max(size, 1).bit_length() - 1)
+        self.mask = self.size - 1
+        self.slots = [None] * self.size
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def newSearch(self):
+        "Marks every stored entry as old, so new results may replace it"
+        self.generation += 1
+
+    def lookup(self, key):
+        "Returns the (key, depth, value, flag, move, generation) entry for key, or None"
+        entry = self.slots[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, value, flag, move=None):
+        index = key & self.mask
+        old = self.slots[index]
+        if old is None or old[0] == key or old[5] != self.generation or depth >= old[1]:
+            self.slots[index] = (key, depth, value, flag, move, self.generation)
+
+    def clear(self):
+        self.slots = [None] * self.size
+        self.hits = self.misses = 0
+
 
 def manhattanDistance( xy1, xy2 ):
     "Returns the Manhattan distance between points xy1 and xy2"
@@ -622,6 +668,118 @@ class TimeoutFunction:
         return result
 
 
+class Watchdog:
+    """
+    Enforces time limits on calls to agent code, like TimeoutFunction, but is
+    set up once and reused for every call of a game.  The SIGALRM handler is
+    installed by install() and the limit of each call is armed with
+    setitimer, so budgets are fractions of a second rather than whole
+    seconds.
+
+      > watchdog = Watchdog()
+      > watchdog.install()
+      > action = watchdog.call(2.5, agent.getAction, state)
+      > watchdog.uninstall()
+
+    Without SIGALRM (or outside the main thread, where signals cannot be
+    handled) a call runs to completion and raises TimeoutFunctionException
+    afterwards if it took too long.
+    """
+    def __init__(self):
+        self.installed = False
+        self.armed = False
+        self.oldHandler = None
+
+    def install(self):
+        import threading
+        if self.installed or not hasattr(signal, 'setitimer'): return
+        if threading.current_thread() is not threading.main_thread(): return
+        self.oldHandler = signal.signal(signal.SIGALRM, self.handle_timeout)
+        self.installed = True
+
+    def uninstall(self):
+        if not self.installed: return
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, self.oldHandler)
+        self.installed = False
+
+    def handle_timeout(self, signum, frame):
+        # a timer that fires just as the call returns is not a timeout
+        if self.armed:
+            self.armed = False
+            raise TimeoutFunctionException()
+
+    def call(self, timeout, function, *args, **keyArgs):
+        "Returns function(*args, **keyArgs), which must finish within timeout seconds"
+        if timeout <= 0:
+            raise TimeoutFunctionException()
+        if not self.installed:
+            startTime = time.time()
+            result = function(*args, **keyArgs)
+            if time.time() - startTime >= timeout:
+                raise TimeoutFunctionException()
+            return result
+        self.armed = True
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            return function(*args, **keyArgs)
+        finally:
+            self.armed = False
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+
+class Histogram:
+    """
+    A histogram of latencies in seconds, counted into fixed buckets from 10
+    microseconds to 10 seconds (the upper bounds are in BOUNDS; slower calls
+    go to a final overflow bucket).  Adding a value is one bisect, so it can
+    sit on the hot path of a game.
+
+      > h = Histogram()
+      > for seconds in [0.003, 0.004, 0.012]: h.add(seconds)
+      > h.quantile(0.5)
+      0.005
+      > h.quantile(0.99)
+      0.012
+    """
+    BOUNDS = (0.00001, 0.00002, 0.00005, 0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005,
+              0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max: self.max = value
+
+    def merge(self, other):
+        "Adds the values counted by another histogram to this one"
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """
+        Returns an upper bound on the q-th quantile: the bound of the bucket
+        it falls in, or the largest value added if that is smaller (as it
+        always is for the overflow bucket).
+        """
+        if self.count == 0: return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.BOUNDS, self.counts):
+            seen += count
+            if seen >= rank: return min(bound, self.max)
+        return self.max
+
 
 _ORIGINAL_STDOUT = None
 _ORIGINAL_STDERR = None